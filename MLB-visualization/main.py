@@ -1,11 +1,40 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import time
+IMPORT_START = time.perf_counter()
+import argparse
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
-    
+from lazy_imports import lazy_import, record_import, report_import_times
+from observations import GENERATOR_MODELS, ObservationGenerator, get_generator
+# transformers and the PDF backend are imported when first used
+record_import('main', time.perf_counter() - IMPORT_START)
+
+# Features of the weighted performance score and their weights; higher weights for HR and AVG
+FEATURES = ['G', 'IP', 'H', 'R', 'ER', 'HR', 'NP', 'SO', 'AVG']
+WEIGHTS = [1, 1, 1, 1, 1, 2, 1, -1, 2]
+
+def weighted_performance(career_stats: pd.DataFrame, group=None) -> pd.Series:
+    """Scale each feature by its maximum, per group if given, and sum with WEIGHTS."""
+    features = career_stats[FEATURES]
+    maxima = features.max() if group is None else features.groupby(group).transform('max')
+    return (features / maxima).multiply(WEIGHTS, axis=1).sum(axis=1)
+
+def plot_weighted_trend(seasons, weighted_features):
+    plot = plt.figure(figsize=(10, 5))
+    plt.plot(seasons, weighted_features, marker='o', linestyle='-', color='b')
+    plt.title('Weighted Performance Trend')
+    plt.xlabel('Season')
+    plt.ylabel('Weighted Performance')
+    plt.grid(True)
+    return plot
+
 class DataAnalysis:
-    def __init__(self, csv_paths: dict):
+    def __init__(self, csv_paths: dict, observation_generator: ObservationGenerator = None):
         self.csv_paths = csv_paths
+        # Defaults to the cached Llama generator, created on first use
+        self.observation_generator = observation_generator
         self.data_frames = {name: None for name in csv_paths}
 
     def load_data(self):
@@ -24,20 +53,15 @@ class DataAnalysis:
         return fig
 
     def generate_observations(self, input_text):
-        tokenizer = AutoTokenizer.from_pretrained("meta-llama/Llama-2-70b-chat-hf", use_auth_token='')
-        model = AutoModelForCausalLM.from_pretrained("meta-llama/Llama-2-70b-chat-hf", use_auth_token='')
-        input_ids = tokenizer.encode(input_text, return_tensors="pt")
-        output = model.generate(
-            input_ids,
-            max_length=1024,
-            temperature=0.2,
-            top_k=30,
-            top_p=0.5,
-        )
-        observations = tokenizer.decode(output[0], skip_special_tokens=True)
-        return observations
+        return self.generate_observations_batch([input_text])[0]
+
+    def generate_observations_batch(self, input_texts):
+        if self.observation_generator is None:
+            self.observation_generator = get_generator()
+        return self.observation_generator.generate(input_texts)
 
     def save_to_pdf(self, pdf_path, plots, observations, report_title, author):
+        PdfPages = lazy_import('matplotlib.backends.backend_pdf').PdfPages
         with PdfPages(pdf_path) as pdf:
             for plot in plots:
                 pdf.savefig(plot)
@@ -49,6 +73,7 @@ class DataAnalysis:
             ax.text(0.05, 0.6, obs_text, fontsize=10)
             ax.axis("off")
             pdf.savefig(fig)
+            plt.close(fig)
 
             pdf.infodict()['Title'] = report_title
             pdf.infodict()['Author'] = author
@@ -57,39 +82,118 @@ class DataAnalysis:
         # Extracting the required features
         career_stats_df = data_frames['career_stats']
 
-        # Define the features and their weights
-        features = ['G', 'IP', 'H', 'R', 'ER', 'HR', 'NP', 'SO', 'AVG']
-        weights = [1, 1, 1, 1, 1, 2, 1, -1, 2]  # Higher weights for HR and AVG
-
         # Normalize and apply weights
-        weighted_features = career_stats_df[features].apply(lambda x: x / x.max(), axis=0)
-        weighted_features = weighted_features.multiply(weights, axis=1).sum(axis=1)
+        weighted_features = weighted_performance(career_stats_df)
 
         # Plotting the trend for weighted features
-        metric = career_stats_df['Season']
-        plot = plt.figure(figsize=(10, 5))
-        plt.plot(metric, weighted_features, marker='o', linestyle='-', color='b')
-        plt.title('Weighted Performance Trend')
-        plt.xlabel('Season')
-        plt.ylabel('Weighted Performance')
-        plt.grid(True)
+        plot = plot_weighted_trend(career_stats_df['Season'], weighted_features)
 
         # Generate observations
         observations = "Shohei Ohtani's performance over seasons, considering the given features and weights."
 
         return [plot], observations
     
-    def analyze(self, pdf_path, report_title, author):
+    def analyze(self, pdf_path, report_title, author, use_llm=True):
         self.load_data()
         plots, observations = self.analysis_function(self.data_frames)
-        observations += "\n" + self.generate_observations("Summary input for LLaMA")
+        if use_llm:
+            observations += "\n" + self.generate_observations("Summary input for LLaMA")
         self.save_to_pdf(pdf_path, plots, observations, report_title, author)
 
-if __name__ == "__main__":
+def use_headless_backend():
+    """Process pool initializer: render with the non-interactive Agg backend."""
+    plt.switch_backend('Agg')
+
+def render_report(pdf_path, seasons, weighted_features, observations, report_title, author):
+    """Plot and write one report; runs inside a worker process."""
+    plot = plot_weighted_trend(seasons, weighted_features)
+    DataAnalysis({}).save_to_pdf(pdf_path, [plot], observations, report_title, author)
+    return pdf_path
+
+def analyze_batch(jobs, report_title, author, observation_generator=None, use_llm=True, max_workers=None):
+    """
+    Write one report per player.
+
+    :param jobs: List of dicts with 'player', 'csv_paths' and 'pdf_path' keys.
+    :param observation_generator: Generator shared by all reports; defaults to the cached Llama generator.
+    :param use_llm: Whether to add generated observations to the reports.
+    :param max_workers: Number of worker processes rendering figures and PDFs.
+    :return: Paths of the written reports, in completion order.
+    """
+    start = time.perf_counter()
+    # Source files shared between players are read once
+    frames = {}
+    for job in jobs:
+        for path in job['csv_paths'].values():
+            if path not in frames:
+                frames[path] = pd.read_csv(path)
+
+    # Weighted performance of every player in one vectorized pass
+    career_stats = pd.concat([frames[job['csv_paths']['career_stats']] for job in jobs],
+                             keys=range(len(jobs)), names=['job', 'row'])
+    weighted = weighted_performance(career_stats, group=career_stats.index.get_level_values('job'))
+
+    observations = [f"{job['player']}'s performance over seasons, considering the given features and weights."
+                    for job in jobs]
+    if use_llm:
+        analysis = DataAnalysis({}, observation_generator)
+        generated = analysis.generate_observations_batch([f"Summary input for LLaMA: {job['player']}" for job in jobs])
+        observations = [text + "\n" + extra for text, extra in zip(observations, generated)]
+
+    written = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=use_headless_backend) as executor:
+        futures = [
+            executor.submit(render_report, job['pdf_path'], career_stats.loc[i, 'Season'].to_numpy(),
+                            weighted.loc[i].to_numpy(), observations[i], f"{report_title} - {job['player']}", author)
+            for i, job in enumerate(jobs)
+        ]
+        for future in as_completed(futures):
+            written.append(future.result())
+            logging.info(f'Report written to {written[-1]} ({len(written)}/{len(jobs)}).')
+    elapsed = time.perf_counter() - start
+    logging.info(f'{len(written)} reports in {elapsed:.1f}s ({len(written) / elapsed * 60:.1f} reports/min).')
+    return written
+
+def main(argv=None) -> int:
+    """
+    Command-line entry point. Each subcommand only imports the backends it uses:
+
+    plot    write the weighted performance plots to the PDF without generated text (no transformers)
+    report  write the full report, including LLM-generated observations (transformers)
+    batch   write one full report per row of a roster CSV (columns: player, pdf, and one path column
+            per source such as career_stats); add --no-llm to skip generated text
+    """
+    parser = argparse.ArgumentParser(description="MLB player data analysis reports.")
+    parser.add_argument('command', choices=['plot', 'report', 'batch'])
+    parser.add_argument('--roster', help="Roster CSV for the batch command.")
+    parser.add_argument('--no-llm', action='store_true', help="Skip generated observations in batch mode.")
+    parser.add_argument('--workers', type=int, help="Worker processes for batch mode.")
+    parser.add_argument('--pdf', default='analysis_report.pdf', help="Path of the PDF report.")
+    parser.add_argument('--title', default='Analysis Report')
+    parser.add_argument('--author', default='Author Name')
+    parser.add_argument('--generator', default='llama', help=f"Observation generator: 'stub', one of {sorted(GENERATOR_MODELS)} or a Hugging Face model name.")
+    parser.add_argument('--cache-dir', help="Folder for the on-disk prompt -> observations cache.")
+    parser.add_argument('--import-budget', type=float, help="Fail if imports take longer than this many seconds.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
     csv_paths = {
         'career_stats': 'data/group1/basic_career_stats.csv',
         'advanced_stats': 'data/group1/advanced_career_stats.csv',
         'other_stats': 'data/other_stats.csv'
     }
-    analysis = DataAnalysis(csv_paths)
-    analysis.analyze('analysis_report.pdf', 'Analysis Report', 'Author Name')
\ No newline at end of file
+    observation_generator = get_generator(args.generator, cache_dir=args.cache_dir)
+    if args.command == 'batch':
+        roster = pd.read_csv(args.roster)
+        jobs = [{'player': row['player'], 'pdf_path': row['pdf'],
+                 'csv_paths': {name: path for name, path in row.items() if name not in ('player', 'pdf')}}
+                for row in roster.to_dict('records')]
+        analyze_batch(jobs, args.title, args.author, observation_generator, use_llm=not args.no_llm,
+                      max_workers=args.workers)
+    else:
+        analysis = DataAnalysis(csv_paths, observation_generator)
+        analysis.analyze(args.pdf, args.title, args.author, use_llm=args.command == 'report')
+    return 0 if report_import_times(args.import_budget) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""Pluggable text generators for report observations, with process-wide model and result caches."""
+import hashlib
+import json
+import os
+from abc import ABC, abstractmethod
+from lazy_imports import lazy_import
+
+# (model name, auth token) -> (tokenizer, model); models are loaded once per process
+_MODEL_CACHE = {}
+
+GENERATOR_MODELS = {
+    'llama': 'meta-llama/Llama-2-70b-chat-hf',
+    'local': 'distilgpt2',
+}
+
+class ObservationGenerator(ABC):
+    """Base class: turns a batch of prompts into a batch of observation texts."""
+    name = 'base'
+
+    @property
+    def cache_identity(self) -> str:
+        """Everything that determines the output for a prompt; cached outputs are keyed by it."""
+        return self.name
+
+    @abstractmethod
+    def generate(self, prompts: list) -> list:
+        """Observation text for each prompt, in the same order."""
+
+class StubGenerator(ObservationGenerator):
+    """Deterministic generator for tests and dry runs; never loads a model."""
+    name = 'stub'
+
+    def generate(self, prompts: list) -> list:
+        return [f"[stub observations for: {prompt}]" for prompt in prompts]
+
+class TransformersGenerator(ObservationGenerator):
+    def __init__(self, model_name=GENERATOR_MODELS['llama'], auth_token='', max_length=1024,
+                 temperature=0.2, top_k=30, top_p=0.5):
+        self.name = model_name
+        self.model_name = model_name
+        self.auth_token = auth_token
+        self.generation_kwargs = {'max_length': max_length, 'temperature': temperature, 'top_k': top_k, 'top_p': top_p}
+
+    @property
+    def cache_identity(self) -> str:
+        return f"{self.name}\n{json.dumps(self.generation_kwargs, sort_keys=True)}"
+
+    def load(self):
+        """Return the tokenizer and model, loading them only on the first call in this process."""
+        key = (self.model_name, self.auth_token)
+        if key not in _MODEL_CACHE:
+            transformers = lazy_import('transformers')
+            tokenizer = transformers.AutoTokenizer.from_pretrained(self.model_name, token=self.auth_token or None)
+            model = transformers.AutoModelForCausalLM.from_pretrained(self.model_name, token=self.auth_token or None)
+            # Decoder-only models need left padding and a pad token to generate for a batch of prompts
+            tokenizer.padding_side = 'left'
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            _MODEL_CACHE[key] = (tokenizer, model)
+        return _MODEL_CACHE[key]
+
+    def generate(self, prompts: list) -> list:
+        tokenizer, model = self.load()
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+        output = model.generate(**inputs, pad_token_id=tokenizer.pad_token_id, **self.generation_kwargs)
+        return tokenizer.batch_decode(output, skip_special_tokens=True)
+
+class CachedGenerator(ObservationGenerator):
+    def __init__(self, backend: ObservationGenerator, cache_dir=None):
+        """
+        Wraps a generator with a prompt -> output cache keyed by a hash of the backend's cache identity
+        (its name and generation settings) and the prompt.
+
+        Results are kept in memory and, if cache_dir is given, also on disk as one JSON file per prompt.
+        """
+        self.backend = backend
+        self.name = backend.name
+        self.cache_dir = cache_dir
+        self.results = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def cache_identity(self) -> str:
+        return self.backend.cache_identity
+
+    def key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self.backend.cache_identity}\n{prompt}".encode()).hexdigest()
+
+    def lookup(self, key: str):
+        if key in self.results or not self.cache_dir:
+            return self.results.get(key)
+        path = os.path.join(self.cache_dir, key + '.json')
+        if os.path.exists(path):
+            with open(path) as cache_file:
+                self.results[key] = json.load(cache_file)['output']
+        return self.results.get(key)
+
+    def store(self, key: str, prompt: str, output: str):
+        self.results[key] = output
+        if self.cache_dir:
+            with open(os.path.join(self.cache_dir, key + '.json'), 'w') as cache_file:
+                json.dump({'backend': self.backend.cache_identity, 'prompt': prompt, 'output': output}, cache_file)
+
+    def generate(self, prompts: list) -> list:
+        keys = [self.key(prompt) for prompt in prompts]
+        missing = {}
+        for key, prompt in zip(keys, prompts):
+            if self.lookup(key) is None:
+                missing[key] = prompt
+        # Only uncached prompts reach the backend, as a single batch
+        if missing:
+            for (key, prompt), output in zip(missing.items(), self.backend.generate(list(missing.values()))):
+                self.store(key, prompt, output)
+        return [self.results[key] for key in keys]
+
+def get_generator(name='llama', cache_dir=None, **kwargs) -> ObservationGenerator:
+    """
+    Build a cached observation generator.
+
+    :param name: 'stub', a key of GENERATOR_MODELS ('llama', 'local'), or any Hugging Face model name.
+    :param cache_dir: Optional folder for the on-disk prompt -> output cache.
+    """
+    if name == 'stub':
+        backend = StubGenerator()
+    else:
+        backend = TransformersGenerator(GENERATOR_MODELS.get(name, name), **kwargs)
+    return CachedGenerator(backend, cache_dir)
@@ -0,0 +1,42 @@
+"""Checks that compact ARIMA states filter and forecast exactly like statsmodels' full results."""
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+from training import extract_state, fit_state, forecast_state, train_model, update_many, update_state
+
+
+@pytest.fixture
+def series():
+    return np.cumsum(np.random.default_rng(0).normal(size=120))
+
+
+@pytest.mark.parametrize('order', [(2, 1, 0), (1, 0, 1)])
+def test_update_and_forecast_match_append(series, order):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        results = train_model(series[:100], order)
+    state = update_state(extract_state(results, order), series[100:])
+    appended = results.append(series[100:], refit=False)
+    np.testing.assert_allclose(forecast_state(state, steps=5), appended.forecast(5), rtol=1e-10)
+    assert state['nobs'] == 120
+
+
+def test_forecast_from_fitted_state_matches_results(series):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        state = fit_state(series, (2, 1, 0))
+        results = train_model(series, (2, 1, 0))
+    np.testing.assert_allclose(forecast_state(state, steps=3), results.forecast(3), rtol=1e-10)
+
+
+def test_update_many_fits_series_without_a_stored_state(series):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        states = {'a:home_runs': fit_state(series[:100], (2, 1, 0))}
+        new_data = pd.DataFrame({'player': ['a'] * 20 + ['b'] * 60,
+                                 'home_runs': np.concatenate([series[100:], series[:60]])})
+        updated = update_many(states, new_data, ['home_runs'], 'player', order=(1, 1, 0))
+        expected = fit_state(series[:60], (1, 1, 0))
+    assert updated['a:home_runs']['nobs'] == 120
+    np.testing.assert_allclose(forecast_state(updated['b:home_runs'], steps=3), forecast_state(expected, steps=3))
@@ -1,6 +1,17 @@
+import argparse
+import ast
+import hashlib
+import json
+import logging
+import os
+import pickle
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 from statsmodels.tsa.arima.model import ARIMA
-import pickle
+from statsmodels.tools.sm_exceptions import MissingDataError
+from statsmodels.tsa.stattools import adfuller
 
 def load_data(csv_path: str):
     """Load the time series data from CSV."""
@@ -8,7 +19,7 @@ def load_data(csv_path: str):
     return data
 
 def preprocess_data(data: pd.DataFrame, target_feature: str):
-    """Preprocess the data by selecting the target feature and making it stationary if needed."""
+    """Preprocess the data by selecting the target feature; differencing is left to the ARIMA order."""
     time_series_data = data[target_feature]
     return time_series_data
 
@@ -30,7 +41,212 @@ def train(csv_path: str, target_feature: str):
     model_fit = train_model(time_series_data)
     save_model(model_fit)
 
+def build_model(observations, order):
+    """Build an ARIMA model over the given observations."""
+    return ARIMA(np.asarray(observations, dtype=float), order=order)
+
+def extract_state(results, order):
+    """Keep only what is needed to continue filtering: parameters and the predicted state at the end of the sample."""
+    return {
+        'order': tuple(order),
+        'params': np.asarray(results.params),
+        'state': results.predicted_state[:, -1].copy(),
+        'state_cov': results.predicted_state_cov[:, :, -1].copy(),
+        'nobs': int(results.nobs),
+    }
+
+def fit_state(time_series_data, order=(5,1,0)):
+    """Fit an ARIMA model and return its compact state."""
+    return extract_state(train_model(np.asarray(time_series_data, dtype=float), order), order)
+
+def update_state(state, new_observations):
+    """Run the Kalman filter over new observations from the stored state, without refitting the parameters."""
+    model = build_model(new_observations, state['order'])
+    model.ssm.initialize_known(state['state'], state['state_cov'])
+    updated = extract_state(model.filter(state['params']), state['order'])
+    updated['nobs'] += state['nobs']
+    return updated
+
+def forecast_state(state, steps=1):
+    """Forecast the next steps directly from the stored state and the model's system matrices."""
+    model = build_model(np.zeros(1), state['order'])
+    model.update(state['params'])
+    design, transition = model.ssm['design'], model.ssm['transition']
+    obs_intercept, state_intercept = model.ssm['obs_intercept'], model.ssm['state_intercept']
+    predicted_state = state['state']
+    forecasts = np.empty(steps)
+    for step in range(steps):
+        forecasts[step] = (design @ predicted_state + obs_intercept)[0]
+        predicted_state = transition @ predicted_state + state_intercept
+    return forecasts
+
+def series_keys(data: pd.DataFrame, target_features, group_column=None):
+    """Yield (key, series) for every target feature, per group if a group column (e.g. player) is given."""
+    groups = [(None, data)] if group_column is None else data.groupby(group_column)
+    for group, group_data in groups:
+        for feature in target_features:
+            yield (feature if group is None else f'{group}:{feature}'), group_data[feature].to_numpy(dtype=float)
+
+def fit_many(data: pd.DataFrame, target_features, group_column=None, order=(5,1,0), max_workers=None):
+    """
+    Fit one compact ARIMA state per series across worker processes.
+
+    :param order: One order for every series, or a mapping of series key to order (as written by
+        search_orders); series missing from the mapping use (5,1,0).
+    """
+    keys, series = zip(*series_keys(data, target_features, group_column))
+    orders = [order.get(key, (5,1,0)) for key in keys] if isinstance(order, dict) else [order] * len(keys)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        states = executor.map(fit_state, series, orders)
+        return dict(zip(keys, states))
+
+def load_orders(csv_path='orders.csv'):
+    """Read the per-series orders written by search_orders into a {series key: order} mapping."""
+    orders = pd.read_csv(csv_path)
+    return {key: tuple(ast.literal_eval(order)) for key, order in zip(orders['series'].astype(str), orders['order'])}
+
+def update_many(states, new_data: pd.DataFrame, target_features, group_column=None, order=(5,1,0)):
+    """
+    Append new observations to every stored series that has any; series without new rows are kept as is.
+
+    Series without a stored state, such as a new player, are fitted from their new observations with
+    fit_state; if that fails, for instance because there are too few observations, they are logged and skipped.
+
+    :param order: Order for newly fitted series: one order for all, or a mapping of series key to order.
+    """
+    updated = dict(states)
+    for key, observations in series_keys(new_data, target_features, group_column):
+        if key in states and len(observations):
+            updated[key] = update_state(states[key], observations)
+        elif key not in states:
+            new_order = order.get(key, (5,1,0)) if isinstance(order, dict) else order
+            try:
+                updated[key] = fit_state(observations, new_order)
+                logging.info(f'Fitted a new state for {key} from {len(observations)} observations.')
+            except (ValueError, np.linalg.LinAlgError) as e:
+                logging.warning(f'Skipped {key}: no stored state and fitting {new_order} failed ({e}).')
+    return updated
+
+def save_states(states, filename='model_states.pkl'):
+    """Save compact model states; no training data is stored."""
+    with open(filename, 'wb') as file:
+        pickle.dump(states, file)
+
+def load_states(filename='model_states.pkl'):
+    """Load compact model states."""
+    with open(filename, 'rb') as file:
+        return pickle.load(file)
+
+def differencing_order(time_series_data, max_d=2, alpha=0.05, default_d=1):
+    """
+    Smallest number of differences after which the ADF test rejects a unit root.
+
+    Missing observations are dropped before testing, as the ADF test cannot skip them the way the
+    Kalman filter does. If the test itself fails, default_d is returned.
+    """
+    series = np.asarray(time_series_data, dtype=float)
+    series = series[np.isfinite(series)]
+    try:
+        for d in range(max_d + 1):
+            if len(series) < 8 or np.ptp(series) == 0 or adfuller(series, autolag='AIC')[1] < alpha:
+                return d
+            series = np.diff(series)
+    except (ValueError, np.linalg.LinAlgError, MissingDataError):
+        return min(default_d, max_d)
+    return max_d
+
+def fit_order(time_series_data, order):
+    """Fit one candidate order and return its information criteria; runs inside a worker process."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            results = train_model(np.asarray(time_series_data, dtype=float), order)
+        return {'aic': float(results.aic), 'bic': float(results.bic),
+                'converged': bool(results.mle_retvals.get('converged', True))}
+    except (ValueError, np.linalg.LinAlgError):
+        return {'aic': float('inf'), 'bic': float('inf'), 'converged': False}
+
+def series_hash(time_series_data):
+    """Identify a series by its values, so cached fits are reused only for identical data."""
+    return hashlib.sha256(np.ascontiguousarray(time_series_data, dtype=float).tobytes()).hexdigest()[:16]
+
+def load_order_cache(cache_dir, digest):
+    path = os.path.join(cache_dir, digest + '.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+def save_order_cache(cache_dir, digest, fits):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, digest + '.json'), 'w') as file:
+        json.dump(fits, file)
+
+def search_orders(data: pd.DataFrame, target_features, group_column=None, p_values=range(0, 6), q_values=range(0, 3),
+                  max_d=2, criterion='aic', cache_dir='order_cache', max_workers=None, max_terms_ratio=0.25):
+    """
+    Select an ARIMA order for every series by AIC or BIC.
+
+    The differencing order d is fixed per series by ADF tests, so only the (p, q) grid is searched. Every
+    fit is cached on disk per series and order, and only uncached orders are fitted, all series together
+    on one process pool.
+
+    :param max_terms_ratio: Orders with p + q above this share of the observations left after differencing
+        are not tried, so short series are not fitted with nearly as many parameters as points.
+    :return: DataFrame with the best converged order and its criteria per series; if no order of a series
+        converged, its best order overall.
+    """
+    candidates = {}
+    for key, series in series_keys(data, target_features, group_column):
+        d = differencing_order(series, max_d)
+        digest = series_hash(series)
+        max_terms = max(0, int(max_terms_ratio * (np.isfinite(series).sum() - d)))
+        orders = [(p, d, q) for p in p_values for q in q_values if p + q <= max_terms] or [(0, d, 0)]
+        candidates[key] = (series, digest, orders, load_order_cache(cache_dir, digest))
+
+    tasks = [(key, order) for key, (_, _, orders, cached) in candidates.items()
+             for order in orders if str(order) not in cached]
+    if tasks:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            fits = executor.map(fit_order, [candidates[key][0] for key, _ in tasks], [order for _, order in tasks],
+                                chunksize=max(1, len(tasks) // (4 * (os.cpu_count() or 1))))
+            for (key, order), fit in zip(tasks, fits):
+                candidates[key][3][str(order)] = fit
+
+    rows = []
+    for key, (_, digest, orders, cached) in candidates.items():
+        save_order_cache(cache_dir, digest, cached)
+        converged = [order for order in orders if cached[str(order)]['converged']]
+        best = min(converged or orders, key=lambda order: cached[str(order)][criterion])
+        rows.append({'series': key, 'order': best, **cached[str(best)]})
+    return pd.DataFrame(rows)
+
 if __name__ == "__main__":
-    csv_path = "data/data.csv" # Update with the correct path to your CSV file
-    target_feature = "home_runs" # Update with the target feature you want to forecast
-    train(csv_path, target_feature)
+    parser = argparse.ArgumentParser(description="Train ARIMA models or update them with new observations.")
+    parser.add_argument('command', nargs='?', default='train', choices=['train', 'fit', 'update', 'search'],
+                        help="train: single full model (pickled results); fit: compact states for many series; "
+                             "update: filter new observations into stored states; search: pick an order per series.")
+    parser.add_argument('--csv', default="data/data.csv", help="CSV with the observations (new ones for update).")
+    parser.add_argument('--features', nargs='+', default=["home_runs"], help="Target features to forecast.")
+    parser.add_argument('--group-column', help="Column identifying separate series, e.g. a player id.")
+    parser.add_argument('--states', default='model_states.pkl', help="Compact state file for fit and update.")
+    parser.add_argument('--criterion', default='aic', choices=['aic', 'bic'], help="Order selection criterion for search.")
+    parser.add_argument('--cache-dir', default='order_cache', help="Folder caching per-series, per-order fits for search.")
+    parser.add_argument('--output', default='orders.csv', help="Selected orders written by search.")
+    parser.add_argument('--orders', help="Per-series orders from search to fit new series with; (5,1,0) for every series otherwise.")
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        train(args.csv, args.features[0])
+    elif args.command == 'fit':
+        order = load_orders(args.orders) if args.orders else (5,1,0)
+        save_states(fit_many(load_data(args.csv), args.features, args.group_column, order), args.states)
+    elif args.command == 'search':
+        orders = search_orders(load_data(args.csv), args.features, args.group_column, criterion=args.criterion,
+                               cache_dir=args.cache_dir)
+        orders.to_csv(args.output, index=False)
+    else:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        order = load_orders(args.orders) if args.orders else (5,1,0)
+        save_states(update_many(load_states(args.states), load_data(args.csv), args.features, args.group_column, order),
+                    args.states)
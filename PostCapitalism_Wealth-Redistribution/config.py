@@ -1,45 +1,148 @@
+import cProfile
+import functools
+import json
 import logging
 import os
+import time
+from contextlib import contextmanager
 from datetime import datetime
-import matplotlib.pyplot as plt
-import inspect
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak memory is then not reported
+    resource = None
+
+PROCESSED_DATA_FOLDER = 'data/output/processed-data'
+PROCESSED_DATA_MANIFEST = PROCESSED_DATA_FOLDER + '/manifest.json'
+PROCESSED_DATA_HISTORY = PROCESSED_DATA_FOLDER + '/versions.jsonl'
+LOGS_FOLDER = 'data/output/logs'
+
+def memory_usage_mb():
+    "Current and peak resident memory of this process in MB; either is None where the platform does not expose it"
+    current = peak = None
+    try:
+        with open('/proc/self/statm') as statm:
+            current = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if os.uname().sysname == 'Darwin' else 2**10)
+    return current, peak
+
+def tracked_stage(name: str = None):
+    """
+    Decorator recording a method call as a stage through its instance's config_manager.
+
+    Row counts are taken from the first positional argument and from the return value when they have a shape.
+
+    :param name: Stage name; defaults to the method name.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            rows = next((len(arg) for arg in args if hasattr(arg, 'shape')), None)
+            with self.config_manager.stage(name or method.__name__, rows=rows) as record:
+                result = method(self, *args, **kwargs)
+                if hasattr(result, 'shape'):
+                    record['rows_out'] = len(result)
+            return result
+        return wrapper
+    return decorator
 
 class ConfigManager:
-    def __init__(self, module_name: str):
+    def __init__(self, module_name: str, profile: bool = False):
+        """
+        :param module_name: Name used for the log, stage metrics and profile files of this run.
+        :param profile: Dump a cProfile of every outermost stage next to the logs.
+        """
         self.module_name = module_name
-    
+        self.profile = profile
+        self.run_id = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
+        self.stage_stack = []
+
+    @property
+    def log_file_path(self) -> str:
+        return f'{LOGS_FOLDER}/{self.module_name}_{self.run_id}.log'
+
+    @property
+    def stage_metrics_path(self) -> str:
+        return f'{LOGS_FOLDER}/{self.module_name}_{self.run_id}_stages.jsonl'
+
     def setup_configuration(self):
-        self.configure_logger()
+        # The logs folder must exist before the file handler opens its log file
         self.check_folder_presence('images')
         self.check_folder_presence('logs')
         self.check_folder_presence('processed-data')
         self.check_folder_presence('models')
+        self.configure_logger()
 
     def configure_logger(self):
-        # Automatically detects the module name from the caller's frame
-        caller_frame = inspect.stack()[1]
-        module_name = inspect.getmodule(caller_frame[0]).__name__
-        # Configuring the logger with a log file path containing the current timestamp and module name
-        log_file_path = 'data/output/logs/' + self.module_name + '_' + datetime.now().strftime("%d-%m-%Y_%H-%M-%S") + '.log'
-        
-        # Create a file handler that writes log messages to a file
-        file_handler = logging.FileHandler(log_file_path)
-        file_handler.setLevel(logging.INFO)
-        
-        # Create a console handler that writes log messages to stdout
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        
-        # Create a formatter and set it for both handlers
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
-        
-        # Get the root logger and add both handlers
+        "Attach a console handler and this module's log file handler to the root logger, each only once per process"
         logger = logging.getLogger()
         logger.setLevel(logging.INFO)
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        # Handlers are tagged so instantiating several managers does not duplicate every log line
+        tags = {getattr(handler, 'config_manager_tag', None) for handler in logger.handlers}
+
+        if 'console' not in tags:
+            console_handler = logging.StreamHandler()
+            console_handler.setLevel(logging.INFO)
+            console_handler.setFormatter(formatter)
+            console_handler.config_manager_tag = 'console'
+            logger.addHandler(console_handler)
+
+        if self.module_name not in tags:
+            file_handler = logging.FileHandler(self.log_file_path)
+            file_handler.setLevel(logging.INFO)
+            file_handler.setFormatter(formatter)
+            file_handler.config_manager_tag = self.module_name
+            logger.addHandler(file_handler)
+
+    @contextmanager
+    def stage(self, name: str, rows: int = None):
+        """
+        Record one pipeline stage as a JSON line in the stage metrics file next to the logs.
+
+        The record holds the wall time, input and output row counts, resident memory before and after
+        and the process peak. The caller may add fields, such as rows_out, to the yielded record. With
+        profiling enabled, the outermost stage also dumps a cProfile in pstats format.
+
+        :param name: Stage name.
+        :param rows: Number of input rows, if meaningful.
+        """
+        rss_before, _ = memory_usage_mb()
+        record = {'module': self.module_name, 'stage': name, 'parent': self.stage_stack[-1] if self.stage_stack else None,
+                  'started': datetime.now().isoformat(timespec='milliseconds'), 'rows_in': rows, 'rows_out': None}
+        profiler = cProfile.Profile() if self.profile and not self.stage_stack else None
+        self.stage_stack.append(name)
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+            record['status'] = 'ok'
+        except Exception as e:
+            record['status'] = f'error: {e}'
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            self.stage_stack.pop()
+            rss_after, peak = memory_usage_mb()
+            record['rss_before_mb'] = rss_before
+            record['rss_after_mb'] = rss_after
+            record['rss_delta_mb'] = rss_after - rss_before if rss_after is not None else None
+            record['peak_rss_mb'] = peak
+            self.check_folder_presence('logs')
+            if profiler is not None:
+                record['profile'] = f'{LOGS_FOLDER}/{self.module_name}_{self.run_id}_{name}.prof'
+                profiler.dump_stats(record['profile'])
+            with open(self.stage_metrics_path, 'a') as metrics_file:
+                metrics_file.write(json.dumps(record) + '\n')
+            logging.info(f"Stage {name} took {record['seconds']:.3f}s ({record['status']}).")
 
     def check_folder_presence(self, folder_name: str):
         # Checking if the folder exists, and if not, creating it
@@ -47,22 +150,107 @@ class ConfigManager:
         if not os.path.exists(folder_path):
             os.makedirs(folder_path)
 
-    def save_plot(self, folder_name: str, file_name: str, datetime_str: str):
-        # Checking and creating the folder if needed
-        self.check_folder_presence(folder_name)
-        # Saving the plot with the specified folder name, file name, and datetime string
-        plt.savefig(f'data/output/{folder_name}/{file_name}_{datetime_str}.png')
+    def save_plot(self, folder_name: str, file_name: str, datetime_str: str, fig=None) -> str:
+        "Save a figure, the current one by default, and close it so repeated runs do not accumulate open figures"
+        import matplotlib.pyplot as plt
+        with self.stage('save_plot') as record:
+            record['plot'] = file_name
+            # Checking and creating the folder if needed
+            self.check_folder_presence(folder_name)
+            fig = fig if fig is not None else plt.gcf()
+            # Saving the plot with the specified folder name, file name, and datetime string
+            plot_path = f'data/output/{folder_name}/{file_name}_{datetime_str}.png'
+            try:
+                fig.savefig(plot_path)
+            finally:
+                plt.close(fig)
+        return plot_path
+
+    def read_manifest(self) -> dict:
+        "Read the processed-data manifest, a small pointer to the latest saved version"
+        if not os.path.exists(PROCESSED_DATA_MANIFEST):
+            return {'latest': None}
+        with open(PROCESSED_DATA_MANIFEST) as manifest_file:
+            return json.load(manifest_file)
+
+    def read_history(self) -> list:
+        "Read every saved version from the append-only history, oldest first"
+        if not os.path.exists(PROCESSED_DATA_HISTORY):
+            return []
+        with open(PROCESSED_DATA_HISTORY) as history_file:
+            return [json.loads(line) for line in history_file if line.strip()]
+
+    def save_processed_data(self, data: pd.DataFrame, file_name: str, datetime_str: str) -> str:
+        "Save processed data as Parquet, append it to the version history and point the manifest at it"
+        self.check_folder_presence('processed-data')
+        data_file = f'{file_name}_{datetime_str}.parquet'
+        data.to_parquet(os.path.join(PROCESSED_DATA_FOLDER, data_file), index=False)
+
+        version = {'file': data_file, 'created': datetime_str, 'rows': len(data), 'columns': list(data.columns)}
+        # Manifests written before the history file existed carried the full version list; move it over once
+        previous_versions = self.read_manifest().get('versions', [])
+        with open(PROCESSED_DATA_HISTORY, 'a') as history_file:
+            for entry in previous_versions + [version]:
+                history_file.write(json.dumps(entry) + '\n')
+
+        # The manifest stays the same small size however many versions exist, so startup reads stay constant
+        manifest = {'latest': data_file, 'created': datetime_str, 'rows': len(data)}
+        # Write to a temporary file first so readers never see a half-written manifest
+        temp_path = PROCESSED_DATA_MANIFEST + '.tmp'
+        with open(temp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(temp_path, PROCESSED_DATA_MANIFEST)
+        return os.path.join(PROCESSED_DATA_FOLDER, data_file)
 
     def find_latest_preprocessed_file(self):
         "Search for the latest output of preprocessed data"
-        folder_path = 'data/output/processed-data'
-        files = [os.path.join(folder_path, file_name) for file_name in os.listdir(folder_path) if file_name.endswith('.csv')]
+        latest_file = self.read_manifest()['latest']
+        if latest_file:
+            return os.path.join(PROCESSED_DATA_FOLDER, latest_file)
+
+        # Fall back to scanning for CSV outputs written before the manifest existed
+        files = [os.path.join(PROCESSED_DATA_FOLDER, file_name) for file_name in os.listdir(PROCESSED_DATA_FOLDER) if file_name.endswith('.csv')]
         
         # Finding the latest file based on modification time
         latest_file = max(files, key=os.path.getmtime) if files else None
         
         return latest_file
-    
+
+    def load_processed_data(self, data_path: str = None, columns: list = None) -> pd.DataFrame:
+        """
+        Load processed data, reading only the requested columns.
+
+        :param data_path: Path to a processed data file; defaults to the latest version in the manifest.
+        :param columns: Columns to read; all columns when None.
+        :return: The loaded DataFrame, or None if no processed data exists.
+        """
+        data_path = data_path or self.find_latest_preprocessed_file()
+        if data_path is None:
+            return None
+        if data_path.endswith('.parquet'):
+            return pd.read_parquet(data_path, columns=columns, memory_map=True)
+        return pd.read_csv(data_path, usecols=columns, thousands=',')
+
+    def iter_processed_data(self, data_path: str = None, columns: list = None, chunk_size: int = 100_000):
+        """
+        Yield processed data in chunks so memory use is bounded by the chunk size.
+
+        :param data_path: Path to a processed data file; defaults to the latest version in the manifest.
+        :param columns: Columns to read, in the order they should be returned; all columns when None.
+        :param chunk_size: Maximum number of rows per chunk.
+        """
+        data_path = data_path or self.find_latest_preprocessed_file()
+        if data_path is None:
+            return
+        if data_path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(data_path, memory_map=True)
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+                yield batch.to_pandas()
+        else:
+            for chunk in pd.read_csv(data_path, usecols=columns, thousands=',', chunksize=chunk_size):
+                yield chunk if columns is None else chunk[columns]
+
     def general_exception_handler(func, *args, **kwargs):
         """
         A general exception handler that can be used to wrap any callable.
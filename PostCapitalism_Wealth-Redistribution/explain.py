@@ -0,0 +1,104 @@
+"""Cached, batched SHAP explanations of the financial aid model through a surrogate tree."""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import shap
+from joblib import Parallel, delayed, dump, load
+from sklearn.tree import DecisionTreeRegressor
+
+
+def fingerprint(model, features: pd.DataFrame, target) -> str:
+    """
+    Hashes the model, the feature data and the surrogate target into a short cache key.
+
+    :param model: The fitted model being explained.
+    :param features: Feature frame the explanations are computed over.
+    :param target: Values the surrogate tree is fitted to.
+    :return: Hex digest identifying this combination.
+    """
+    digest = hashlib.sha256()
+    digest.update(pickle.dumps(model))
+    digest.update(json.dumps([str(column) for column in features.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(features, index=False).to_numpy().tobytes())
+    digest.update(np.ascontiguousarray(target).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def explain_batch(surrogate, batch: np.ndarray, approximate: bool) -> np.ndarray:
+    """Computes the SHAP values of one row batch; runs inside a worker process."""
+    return shap.TreeExplainer(surrogate).shap_values(batch, approximate=approximate)
+
+
+class ShapExplainer:
+    def __init__(self, cache_dir='data/output/explanations', batch_size=1000, n_jobs=-1, random_state=42):
+        """
+        Explains a model with a surrogate decision tree, caching the tree and its SHAP values on disk.
+
+        :param cache_dir: Folder holding one sub-folder per model and data fingerprint.
+        :param batch_size: Number of rows explained per worker task.
+        :param n_jobs: Number of worker processes, -1 for all cores.
+        :param random_state: Seed for the surrogate tree and for row sampling.
+        """
+        self.cache_dir = cache_dir
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def load_surrogate(self, cache_path: str, features: pd.DataFrame, target) -> DecisionTreeRegressor:
+        """
+        Loads the cached surrogate tree, fitting and caching it first if needed.
+        """
+        surrogate_path = os.path.join(cache_path, 'surrogate.pkl')
+        if os.path.exists(surrogate_path):
+            return load(surrogate_path)
+        surrogate = DecisionTreeRegressor(random_state=self.random_state)
+        surrogate.fit(features.to_numpy(), target)
+        dump(surrogate, surrogate_path)
+        return surrogate
+
+    def explain(self, model, features: pd.DataFrame, target, sample_size: int = None,
+                approximate: bool = False) -> (np.ndarray, np.ndarray):
+        """
+        Returns SHAP values for the given features, reusing cached results when nothing changed.
+
+        :param model: The fitted model being explained; part of the cache key.
+        :param features: Feature frame to explain.
+        :param target: Model output the surrogate tree is fitted to, e.g. the financial aid rank.
+        :param sample_size: If set and smaller than the number of rows, only a random sample of rows is explained.
+        :param approximate: Use the fast Saabas approximation instead of exact tree SHAP.
+        :return: Memory-mapped (rows x features) SHAP values and the positions of the explained rows.
+        """
+        cache_path = os.path.join(self.cache_dir, fingerprint(model, features, target))
+        mode = f"{'approx' if approximate else 'exact'}_{sample_size if sample_size and sample_size < len(features) else 'all'}"
+        values_path = os.path.join(cache_path, f'shap_{mode}.npy')
+        rows_path = os.path.join(cache_path, f'rows_{mode}.npy')
+        if os.path.exists(values_path) and os.path.exists(rows_path):
+            logging.info(f'SHAP values loaded from cache {values_path}.')
+            return np.load(values_path, mmap_mode='r'), np.load(rows_path)
+
+        os.makedirs(cache_path, exist_ok=True)
+        surrogate = self.load_surrogate(cache_path, features, target)
+        rows = np.arange(len(features))
+        if sample_size and sample_size < len(features):
+            rows = np.sort(np.random.default_rng(self.random_state).choice(rows, sample_size, replace=False))
+        values = features.to_numpy()[rows]
+
+        # Write batches into a memory-mapped array as workers finish, then publish it under its final name
+        temp_path = values_path + '.tmp.npy'
+        shap_values = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float64, shape=values.shape)
+        starts = range(0, len(values), self.batch_size)
+        batches = Parallel(n_jobs=self.n_jobs, return_as='generator')(
+            delayed(explain_batch)(surrogate, values[start:start + self.batch_size], approximate) for start in starts
+        )
+        for start, batch_values in zip(starts, batches):
+            shap_values[start:start + len(batch_values)] = batch_values
+        shap_values.flush()
+        del shap_values
+        os.replace(temp_path, values_path)
+        np.save(rows_path, rows)
+        logging.info(f'SHAP values for {len(rows)} rows saved to {values_path}.')
+        return np.load(values_path, mmap_mode='r'), rows
@@ -1,15 +1,54 @@
 """Module to train a Gaussian Mixture Model for financial aid prediction using preprocessed data."""
-from config import ConfigManager
+from config import ConfigManager, tracked_stage
 from datetime import datetime
 from sklearn.mixture import GaussianMixture
 from sklearn.model_selection import train_test_split
 from sklearn.impute import SimpleImputer
+import argparse
 import logging
+import time
 import joblib
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import warnings
+from plotting import PlotRenderer, downsample, render_pairplot
+from streaming_gmm import ChunkedGaussianMixture
+
+def fit_gmm_chain(X_train, X_val, n_components_grid, covariance_type, seed):
+    """
+    Fit GMMs of increasing size for one covariance type and seed, warm-starting each from its smaller neighbor.
+
+    The components of the previous fit are kept as initial means and the extra components are seeded
+    at the training points the previous fit explains worst.
+    Returns the per-fit validation scores and the chain's best model by validation BIC.
+    """
+    results, best_model, previous = [], None, None
+    X_train_values = X_train.to_numpy()
+    for n_components in sorted(n_components_grid):
+        init = {}
+        if previous is not None:
+            extra = n_components - previous.n_components
+            worst = np.argsort(previous.score_samples(X_train))[:extra]
+            init['means_init'] = np.vstack([previous.means_, X_train_values[worst]])
+            weights = np.append(previous.weights_, np.full(extra, 1.0 / n_components))
+            init['weights_init'] = weights / weights.sum()
+        start = time.perf_counter()
+        model = GaussianMixture(n_components=n_components, covariance_type=covariance_type, random_state=seed, **init)
+        model.fit(X_train)
+        result = {
+            'n_components': n_components,
+            'covariance_type': covariance_type,
+            'seed': seed,
+            'val_bic': model.bic(X_val),
+            'val_log_likelihood': model.score(X_val),
+            'converged': model.converged_,
+            'n_iter': model.n_iter_,
+            'fit_seconds': time.perf_counter() - start,
+        }
+        if best_model is None or result['val_bic'] < min(r['val_bic'] for r in results):
+            best_model = model
+        results.append(result)
+        previous = model
+    return results, best_model
 
 class FinancialAidModelTrainer:
     def __init__(self):
@@ -17,16 +56,18 @@ class FinancialAidModelTrainer:
         script_name = "finaid_train"
         self.config_manager = ConfigManager(script_name)
         self.config_manager.setup_configuration()
+        self.plot_renderer = PlotRenderer(self.config_manager)
         self.selected_features = ['Density\n(P/Km2)', 'Agricultural Land( %)', 'CPI', 'Fertility Rate',
                                   'Unemployment rate', 'Urban_population']
         self.model_name = "FinancialAidGMM"
 
+    @tracked_stage()
     def load_data(self):
-        """Load the latest preprocessed data from CSV file."""
+        """Load the selected feature columns of the latest preprocessed data."""
         data_path = self.config_manager.find_latest_preprocessed_file()
         try:
             if data_path:
-                data = pd.read_csv(data_path, thousands=',')  # Handle thousands separator
+                data = self.config_manager.load_processed_data(data_path, columns=self.selected_features)
                 logging.info('Data loaded successfully from ' + data_path)
                 return data
             else:
@@ -36,6 +77,7 @@ class FinancialAidModelTrainer:
             logging.error(f"Error loading data: {e}")
             return None
 
+    @tracked_stage()
     def preprocess_data(self, data):
         """Preprocess the data by imputing missing values and selecting specific features."""
         features = data[self.selected_features]
@@ -44,6 +86,7 @@ class FinancialAidModelTrainer:
         features_imputed = pd.DataFrame(features_imputed, columns=self.selected_features)
         return features_imputed
 
+    @tracked_stage()
     def train_model(self, X_train):
         """Train the Gaussian Mixture Model using the given training data."""
         model = GaussianMixture(n_components=3)
@@ -51,35 +94,105 @@ class FinancialAidModelTrainer:
         logging.info('FinancialAidGMM model trained successfully.')
         return model
 
-    def visualize_clusters(self, data, clusters):
-        """Visualize the data clusters using Seaborn pairplot and save the plot as an image."""
-        warnings.filterwarnings("ignore", message="The figure layout has changed to tight") # Ignore the specific UserWarnings related to tight_layout
+    @tracked_stage()
+    def train_model_streaming(self, data_path, chunk_size=100_000, n_components=3, max_iter=100, random_state=42):
+        """Train the Gaussian Mixture Model over chunks of the processed data, bounding memory by the chunk size."""
+        def feature_chunks():
+            for chunk in self.config_manager.iter_processed_data(data_path, self.selected_features, chunk_size):
+                yield chunk[self.selected_features].to_numpy(dtype=float)
+
+        # Median of the chunk medians approximates the in-memory median imputation without holding all rows
+        medians = np.nanmedian(np.vstack([np.nanmedian(chunk, axis=0) for chunk in feature_chunks()]), axis=0)
+
+        def imputed_chunks():
+            for chunk in feature_chunks():
+                yield np.where(np.isnan(chunk), medians, chunk)
+
+        mixture = ChunkedGaussianMixture(n_components=n_components, max_iter=max_iter, random_state=random_state)
+        model = mixture.fit(imputed_chunks).to_gaussian_mixture(self.selected_features)
+        logging.info(f'FinancialAidGMM model trained over chunks of {chunk_size} rows in {model.n_iter_} EM passes.')
+        return model
+
+    @tracked_stage()
+    def search_models(self, X_train, X_val, n_components_grid=range(1, 9),
+                      covariance_types=('full', 'tied', 'diag', 'spherical'), seeds=(0, 1, 2), n_jobs=-1):
+        """Fit GMMs across the grid in parallel processes, score them on the validation set and return the best by BIC."""
+        chains = joblib.Parallel(n_jobs=n_jobs, backend='loky')(
+            joblib.delayed(fit_gmm_chain)(X_train, X_val, n_components_grid, covariance_type, seed)
+            for covariance_type in covariance_types for seed in seeds
+        )
+        results = pd.DataFrame([result for chain_results, _ in chains for result in chain_results])
+        results = results.sort_values('val_bic').reset_index(drop=True)
+        best_model = min(chains, key=lambda chain: min(r['val_bic'] for r in chain[0]))[1]
+        logging.info(f"Best model: {best_model.n_components} components, '{best_model.covariance_type}' covariance "
+                     f"(validation BIC {results['val_bic'].iloc[0]:.2f}) out of {len(results)} fits.")
+        return best_model, results
+
+    def save_search_results(self, results):
+        """Save the model search results table next to the trained model."""
+        datetime_str = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
+        results_path = f'data/output/models/{self.model_name}_search_results_{datetime_str}.csv'
+        results.to_csv(results_path, index=False)
+        logging.info(f'Model search results saved as {results_path}.')
+
+    @tracked_stage()
+    def visualize_clusters(self, data, clusters, max_points=2000):
+        """Queue a Seaborn pairplot of the clusters, drawn from at most max_points rows, for background rendering."""
         data['Cluster'] = clusters
-        sns.pairplot(data, hue='Cluster', vars=self.selected_features)
-        plt.tight_layout()
+        sample = downsample(data[self.selected_features + ['Cluster']], max_points)
+        if len(sample) < len(data):
+            logging.info(f'Pairplot drawn from a sample of {len(sample)} of {len(data)} rows.')
         datetime_str = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
-        self.config_manager.save_plot('images', 'clusters_visualization', datetime_str)
-        logging.info(f'Visualization saved as clusters_visualization_{datetime_str}.png.')
+        self.plot_renderer.submit('clusters_visualization', render_pairplot, sample, 'Cluster', self.selected_features,
+                                  datetime_str=datetime_str)
 
+    @tracked_stage()
     def save_model(self, model):
         """Save the trained Gaussian Mixture Model to a file."""
         model_path = f'data/output/models/{self.model_name}_model.pkl'
         joblib.dump(model, model_path)
         logging.info(f'Model saved as {model_path}.')
 
-    def run(self):
-        """Execute the complete training process including loading, preprocessing, training, visualizing, and saving the model."""
+    def run_streaming(self, chunk_size=100_000):
+        """Execute the training process in chunks for datasets that do not fit in memory, and save the model."""
+        data_path = self.config_manager.find_latest_preprocessed_file()
+        if data_path is None:
+            logging.error('No preprocessed data file found.')
+            return
+        model = self.train_model_streaming(data_path, chunk_size=chunk_size)
+        self.save_model(model)
+
+    def run(self, search=False):
+        """Execute the complete training process including loading, preprocessing, training, visualizing, and saving the model.
+
+        With search=True, a model search over the GMM grid replaces the fixed three-component fit.
+        """
         data = self.load_data()
         if data is not None:
             features_imputed = self.preprocess_data(data)
             X_temp, X_test = train_test_split(features_imputed, test_size=0.20, random_state=42)
             X_train, X_val = train_test_split(X_temp, test_size=0.1875, random_state=42)
             logging.info('Data split into training, validation, and testing sets.')
-            model = self.train_model(X_train)
+            if search:
+                model, results = self.search_models(X_train, X_val)
+                self.save_search_results(results)
+            else:
+                model = self.train_model(X_train)
             clusters = model.predict(features_imputed)
             self.visualize_clusters(data, clusters)
             self.save_model(model)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the financial aid Gaussian Mixture Model.")
+    parser.add_argument('--search', action='store_true', help="Search component counts, covariance types and seeds instead of a single fit.")
+    parser.add_argument('--streaming', action='store_true', help="Train over chunks of the processed data with bounded memory.")
+    parser.add_argument('--chunk-size', type=int, default=100_000, help="Rows per chunk in streaming mode.")
+    parser.add_argument('--profile', action='store_true', help="Dump a cProfile of every top-level stage next to the logs.")
+    args = parser.parse_args()
     trainer = FinancialAidModelTrainer()
-    trainer.run()
+    trainer.config_manager.profile = args.profile
+    if args.streaming:
+        trainer.run_streaming(chunk_size=args.chunk_size)
+    else:
+        trainer.run(search=args.search)
+    trainer.plot_renderer.wait()
@@ -0,0 +1,48 @@
+"""Deferred imports of heavy backends, timed so command-line cold starts can be kept within a budget."""
+import importlib
+import logging
+import sys
+import time
+
+# Seconds spent importing each module through this helper, in import order
+IMPORT_TIMES = {}
+
+
+def record_import(name: str, seconds: float):
+    """Record import time that was measured outside of lazy_import, e.g. a module's own top-level imports."""
+    IMPORT_TIMES[name] = IMPORT_TIMES.get(name, 0.0) + seconds
+
+
+def lazy_import(module_name: str):
+    """
+    Import a module on first use and record how long the import took.
+
+    :param module_name: Dotted module name, e.g. 'plotly.express'.
+    :return: The imported module.
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    record_import(module_name, time.perf_counter() - start)
+    return module
+
+
+def report_import_times(budget: float = None) -> bool:
+    """
+    Log the recorded import times and compare their total against a budget.
+
+    :param budget: Maximum total import time in seconds; no check when None.
+    :return: False if the budget was exceeded, True otherwise.
+    """
+    total = sum(IMPORT_TIMES.values())
+    for name, seconds in IMPORT_TIMES.items():
+        logging.info(f'Import {name}: {seconds:.3f}s')
+    if budget is None:
+        logging.info(f'Total import time: {total:.3f}s')
+        return True
+    if total > budget:
+        logging.warning(f'Total import time {total:.3f}s exceeds the budget of {budget:.3f}s.')
+        return False
+    logging.info(f'Total import time: {total:.3f}s (budget {budget:.3f}s)')
+    return True
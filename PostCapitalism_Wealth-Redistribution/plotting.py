@@ -0,0 +1,136 @@
+"""Headless plot rendering in a background process, skipping plots whose input data has not changed."""
+import hashlib
+import json
+import logging
+import os
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor, wait
+import numpy as np
+import pandas as pd
+
+PLOT_CACHE = 'data/output/images/plot_cache.json'
+
+def use_headless_backend():
+    """Process pool initializer: render with the non-interactive Agg backend."""
+    import matplotlib
+    matplotlib.use('Agg')
+
+def data_hash(data: pd.DataFrame) -> str:
+    """Hash of the values, index and column names of a DataFrame."""
+    row_hashes = pd.util.hash_pandas_object(data, index=True).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes() + repr(list(data.columns)).encode()).hexdigest()
+
+def downsample(data: pd.DataFrame, max_rows: int, random_state=0) -> pd.DataFrame:
+    """Uniform random sample of at most max_rows rows; smaller data is returned as is."""
+    return data if len(data) <= max_rows else data.sample(n=max_rows, random_state=random_state)
+
+def missing_value_profile(data: pd.DataFrame, max_rows=1000) -> pd.DataFrame:
+    """
+    Missing-value mask of the data for the heatmap.
+
+    Larger inputs are reduced to max_rows consecutive bands holding each band's share of missing cells,
+    so the heatmap keeps its shape without drawing one row per record.
+    """
+    missing = data.isnull()
+    if len(missing) <= max_rows:
+        return missing
+    bands = np.arange(len(missing)) * max_rows // len(missing)
+    return missing.groupby(bands).mean()
+
+def render_missing_values(missing: pd.DataFrame, title: str):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    fig, ax = plt.subplots(figsize=(10, 8))
+    sns.heatmap(missing, cbar=True, cmap='viridis', ax=ax)
+    ax.set_title(title)
+    return fig
+
+def render_pairplot(data: pd.DataFrame, hue: str, features: list):
+    import seaborn as sns
+    warnings.filterwarnings("ignore", message="The figure layout has changed to tight") # Ignore the specific UserWarnings related to tight_layout
+    grid = sns.pairplot(data, hue=hue, vars=features)
+    grid.figure.tight_layout()
+    return grid.figure
+
+def render_and_save(config_manager, render, args, folder_name: str, file_name: str, datetime_str: str) -> str:
+    """Render a figure and save it through the config manager, which also closes it."""
+    return config_manager.save_plot(folder_name, file_name, datetime_str, fig=render(*args))
+
+class PlotRenderer:
+    def __init__(self, config_manager, background=True, cache_path=PLOT_CACHE):
+        """
+        Renders pipeline plots on the Agg backend, by default in one background process so the pipeline does not wait for them.
+
+        A plot is skipped when the hash of its input data and arguments matches the one recorded in the
+        cache under its name and the image rendered then still exists.
+
+        :param config_manager: ConfigManager used to save the images and record the rendering stages.
+        :param background: Render in a worker process; otherwise render inline.
+        :param cache_path: JSON file mapping plot names to their last input hash and image path.
+        """
+        self.config_manager = config_manager
+        self.background = background
+        self.cache_path = cache_path
+        self.executor = None
+        self.futures = []
+        self.lock = threading.Lock()
+
+    def read_cache(self) -> dict:
+        if not os.path.exists(self.cache_path):
+            return {}
+        with open(self.cache_path) as cache_file:
+            return json.load(cache_file)
+
+    def record(self, name: str, key: str, path: str):
+        """Record a rendered plot in the cache, replacing the file atomically as the processed-data manifest does."""
+        with self.lock:
+            cache = self.read_cache()
+            cache[name] = {'hash': key, 'path': path}
+            temp_path = self.cache_path + '.tmp'
+            with open(temp_path, 'w') as cache_file:
+                json.dump(cache, cache_file, indent=2)
+            os.replace(temp_path, self.cache_path)
+
+    def submit(self, name: str, render, data: pd.DataFrame, *args, folder_name='images', datetime_str='') -> str:
+        """
+        Render and save a plot unless the same input was already rendered.
+
+        :param name: Plot name, used as the image file name prefix and cache entry.
+        :param render: Module-level function building the figure from data and args.
+        :param data: Plotted data; it is hashed to decide whether the plot changed.
+        :return: Path of the image, which may still be rendering in the background.
+        """
+        key = hashlib.sha1(f'{render.__name__}:{data_hash(data)}:{args!r}'.encode()).hexdigest()
+        cached = self.read_cache().get(name)
+        if cached and cached['hash'] == key and os.path.exists(cached['path']):
+            logging.info(f'Input of {name} is unchanged; keeping {cached["path"]}.')
+            return cached['path']
+
+        self.config_manager.check_folder_presence(folder_name)
+        path = f'data/output/{folder_name}/{name}_{datetime_str}.png'
+        job = (self.config_manager, render, (data,) + args, folder_name, name, datetime_str)
+        if not self.background:
+            self.record(name, key, render_and_save(*job))
+            return path
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1, initializer=use_headless_backend)
+        future = self.executor.submit(render_and_save, *job)
+        future.add_done_callback(lambda done: self.finish(name, key, done))
+        self.futures.append(future)
+        return path
+
+    def finish(self, name: str, key: str, future):
+        if future.exception() is not None:
+            logging.error(f'Rendering {name} failed: {future.exception()}')
+        else:
+            self.record(name, key, future.result())
+            logging.info(f'Plot saved as {future.result()}.')
+
+    def wait(self):
+        """Block until every submitted plot is rendered and stop the worker process."""
+        wait(self.futures)
+        self.futures = []
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
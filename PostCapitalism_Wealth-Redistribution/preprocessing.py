@@ -1,80 +1,129 @@
-from config import ConfigManager
+from config import ConfigManager, tracked_stage
 from datetime import datetime
+import argparse
+import os
+import joblib
+import numpy as np
 import pandas as pd
+import sklearn
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.impute import KNNImputer
 import logging
-import seaborn as sns
-import matplotlib.pyplot as plt
+from plotting import PlotRenderer, missing_value_profile, render_missing_values
+
+# Bump whenever the layout of the saved preprocessing state changes
+STATE_VERSION = 2
+# A raw cell is numeric-like if it is a number once currency, percent and thousands symbols are removed
+NUMERIC_PATTERN = r'\s*\$?\s*[-+]?[\d,]*\.?\d+\s*%?\s*'
+SYMBOL_PATTERN = r'[$,%\s]'
 
 class DataPreprocessor:
-    def __init__(self, feature_range=(0, 1), missing_value_strategy='median'):
+    def __init__(self, feature_range=(0, 1), missing_value_strategy='median',
+                 state_path='data/output/models/DataPreprocessor_state.pkl', key_column='Country'):
         script_name = "preprocessing"
         self.config_manager = ConfigManager(script_name)
         self.config_manager.setup_configuration()
+        self.plot_renderer = PlotRenderer(self.config_manager)
         self.feature_range = feature_range
         self.missing_value_strategy = missing_value_strategy
+        self.state_path = state_path
+        self.key_column = key_column
         self.datetime_str = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
+        # Fitted state, populated by preprocess_data or load_state
+        self.conversion_plan = {}
+        self.fill_values = None
+        self.imputer = None
+        self.scaler = None
+        self.numeric_columns = []
+        self.row_hashes = None
 
+    @tracked_stage()
     def visualize_missing_values(self, data: pd.DataFrame, stage: int):
-        plt.figure(figsize=(10, 8))
-        sns.heatmap(data.isnull(), cbar=True, cmap='viridis')
-        plt.title("Missing Values Heatmap - Stage " + str(stage))
-        self.config_manager.save_plot('images', f'missing_values_stage_{stage}', self.datetime_str)
-
-    def impute_missing_values_with_knn(self, df: pd.DataFrame) -> pd.DataFrame:
-        numeric_df = df.select_dtypes(include=['number'])
-        non_numeric_df = df.select_dtypes(exclude=['number'])
-        imputer = KNNImputer(n_neighbors=5)
-        imputed_numeric_data = imputer.fit_transform(numeric_df)
+        """Queue the missing values heatmap for background rendering; it is skipped if the missing values are unchanged."""
+        self.plot_renderer.submit(f'missing_values_stage_{stage}', render_missing_values, missing_value_profile(data),
+                                  "Missing Values Heatmap - Stage " + str(stage), datetime_str=self.datetime_str)
+
+    @tracked_stage()
+    def impute_missing_values_with_knn(self, df: pd.DataFrame, fit: bool = True) -> pd.DataFrame:
+        if fit:
+            self.numeric_columns = list(df.select_dtypes(include=['number']).columns)
+            self.imputer = KNNImputer(n_neighbors=5).fit(df[self.numeric_columns])
+        numeric_df = df[self.numeric_columns]
+        non_numeric_df = df.drop(columns=self.numeric_columns)
+        imputed_numeric_data = self.imputer.transform(numeric_df)
         imputed_numeric_df = pd.DataFrame(imputed_numeric_data, columns=numeric_df.columns, index=numeric_df.index)
         return pd.concat([imputed_numeric_df, non_numeric_df], axis=1)
 
-    def convert_currency_and_percentage_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+    def infer_column_schema(self, df: pd.DataFrame) -> dict:
+        """Classify every non-numeric column once as 'currency', 'percent', 'thousands' or 'text'."""
+        schema = {}
         for col in df.columns:
-            if df[col].dtype == 'object':
-                first_non_null_value = df[col].dropna().iloc[0]
-                if '$' in str(first_non_null_value):
-                    df[col] = df[col].replace('[\\\\$,]', '', regex=True).astype(float)
-                elif '%' in str(first_non_null_value):
-                    df[col] = df[col].replace('%', '', regex=True).astype(float) / 100
-                else:
-                    try:
-                        # Try to convert any other object columns containing comma-separated numbers
-                        df[col] = df[col].str.replace(',', '').astype(float)
-                    except ValueError:
-                        pass  # Skip columns that can't be converted
-        return df
-
-    def handle_missing_values(self, data: pd.DataFrame) -> pd.DataFrame:
+            if pd.api.types.is_numeric_dtype(df[col]):
+                continue
+            values = df[col].dropna().astype(str)
+            if values.empty or not values.str.fullmatch(NUMERIC_PATTERN).all():
+                schema[col] = 'text'
+            elif values.str.contains('$', regex=False).any():
+                schema[col] = 'currency'
+            elif values.str.contains('%', regex=False).any():
+                schema[col] = 'percent'
+            else:
+                schema[col] = 'thousands'
+        return schema
+
+    @tracked_stage()
+    def convert_currency_and_percentage_columns(self, df: pd.DataFrame, fit: bool = True) -> pd.DataFrame:
+        if fit:
+            self.conversion_plan = self.infer_column_schema(df)
+        numeric_columns = [col for col, kind in self.conversion_plan.items()
+                           if kind != 'text' and not pd.api.types.is_numeric_dtype(df[col])]
+        if not numeric_columns:
+            return df
+        # Strip symbols and separators from every numeric-like column in one vectorized pass
+        raw_values = pd.Series(df[numeric_columns].to_numpy(dtype=object).ravel(), dtype=object)
+        parsed = pd.to_numeric(raw_values.str.replace(SYMBOL_PATTERN, '', regex=True), errors='coerce')
+        parsed = parsed.to_numpy(dtype=float).reshape(len(df), len(numeric_columns))
+        scale = np.array([0.01 if self.conversion_plan[col] == 'percent' else 1.0 for col in numeric_columns])
+        converted = pd.DataFrame(parsed * scale, columns=numeric_columns, index=df.index)
+        return df.drop(columns=numeric_columns).join(converted)[df.columns]
+
+    @tracked_stage()
+    def handle_missing_values(self, data: pd.DataFrame, fit: bool = True) -> pd.DataFrame:
         logging.info("Handling missing values.")
-        if self.missing_value_strategy == 'median':
-            return data.fillna(data.median(numeric_only=True))
-        elif self.missing_value_strategy == 'mean':
-            return data.fillna(data.mean(numeric_only=True))
-        else:
-            raise ValueError(f"Invalid missing value strategy: {self.missing_value_strategy}")
-
-    def normalize_features(self, data: pd.DataFrame) -> pd.DataFrame:
+        if fit:
+            if self.missing_value_strategy == 'median':
+                self.fill_values = data.median(numeric_only=True)
+            elif self.missing_value_strategy == 'mean':
+                self.fill_values = data.mean(numeric_only=True)
+            else:
+                raise ValueError(f"Invalid missing value strategy: {self.missing_value_strategy}")
+        return data.fillna(self.fill_values)
+
+    @tracked_stage()
+    def normalize_features(self, data: pd.DataFrame, fit: bool = True) -> pd.DataFrame:
         logging.info(f"Normalizing the features to the range {self.feature_range}.")
-        non_numeric_data = data.select_dtypes(include=['object'])
-        numeric_data = data.select_dtypes(exclude=['object'])
-        
-        # Converting any object-type numeric columns that may contain comma-separated numbers
-        numeric_data = numeric_data.apply(lambda x: x.str.replace(',', '').astype(float) if x.dtype == 'object' else x)
-        
-        scaler = MinMaxScaler(feature_range=self.feature_range)
-        data_scaled = scaler.fit_transform(numeric_data)
-        normalized_data = pd.DataFrame(data_scaled, columns=numeric_data.columns)
-        
+        numeric_data = data[self.numeric_columns]
+        non_numeric_data = data.drop(columns=self.numeric_columns)
+
+        if fit:
+            self.scaler = MinMaxScaler(feature_range=self.feature_range).fit(numeric_data)
+        data_scaled = self.scaler.transform(numeric_data)
+        normalized_data = pd.DataFrame(data_scaled, columns=numeric_data.columns, index=numeric_data.index)
+
         # Concatenating non-numeric data back to the normalized DataFrame
         for col in non_numeric_data.columns:
             normalized_data[col] = non_numeric_data[col].values
-            
+
         return normalized_data
 
+    def hash_rows(self, data: pd.DataFrame) -> pd.Series:
+        """Hash every raw row, indexed by the key column, to detect new or changed rows."""
+        return pd.util.hash_pandas_object(data.set_index(self.key_column), index=False)
+
+    @tracked_stage()
     def preprocess_data(self, data: pd.DataFrame) -> pd.DataFrame:
         logging.info("Starting preprocessing steps.")
+        self.row_hashes = self.hash_rows(data)
         self.visualize_missing_values(data, stage=1)
         data = self.convert_currency_and_percentage_columns(data)
         data = self.handle_missing_values(data)
@@ -83,12 +132,85 @@ class DataPreprocessor:
         logging.info("Preprocessing completed successfully.")
         return data
 
+    @tracked_stage()
+    def transform(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Apply the fitted preprocessing state to new rows without refitting anything."""
+        if self.scaler is None:
+            raise ValueError("DataPreprocessor has not been fitted; run preprocess_data or load_state first.")
+        data = self.convert_currency_and_percentage_columns(data, fit=False)
+        data = self.handle_missing_values(data, fit=False)
+        data = self.impute_missing_values_with_knn(data, fit=False)
+        return self.normalize_features(data, fit=False)
+
+    @tracked_stage()
+    def update_processed_data(self, raw_data: pd.DataFrame, processed_data: pd.DataFrame) -> pd.DataFrame:
+        """Transform only the raw rows that are new or changed since the state was fitted, merge them in and drop removed rows."""
+        hashes = self.hash_rows(raw_data)
+        changed = hashes.ne(self.row_hashes.reindex(hashes.index)).to_numpy()
+        # Rows whose key no longer appears in the raw data were removed from it
+        processed_data = processed_data[processed_data[self.key_column].isin(hashes.index)]
+        removed = len(self.row_hashes.index.difference(hashes.index))
+        self.row_hashes = self.row_hashes[self.row_hashes.index.isin(hashes.index)]
+        logging.info(f"{changed.sum()} of {len(raw_data)} rows are new or changed, {removed} were removed.")
+        if not changed.any():
+            return processed_data.reset_index(drop=True)
+        updated_rows = self.transform(raw_data[changed])
+        unchanged = processed_data[~processed_data[self.key_column].isin(updated_rows[self.key_column])]
+        self.row_hashes = pd.concat([self.row_hashes.drop(hashes.index[changed], errors='ignore'), hashes[changed]])
+        return pd.concat([unchanged, updated_rows[processed_data.columns]], ignore_index=True)
+
+    def save_state(self):
+        """Save the fitted preprocessing state as a versioned artifact next to the trained models."""
+        state = {
+            'version': STATE_VERSION,
+            'sklearn_version': sklearn.__version__,
+            'feature_range': self.feature_range,
+            'missing_value_strategy': self.missing_value_strategy,
+            'key_column': self.key_column,
+            'conversion_plan': self.conversion_plan,
+            'fill_values': self.fill_values,
+            'numeric_columns': self.numeric_columns,
+            'imputer': self.imputer,
+            'scaler': self.scaler,
+            'row_hashes': self.row_hashes,
+        }
+        joblib.dump(state, self.state_path)
+        logging.info(f'Preprocessing state saved as {self.state_path}.')
+
+    def load_state(self):
+        """Load a previously saved preprocessing state so new rows can be transformed without refitting."""
+        state = joblib.load(self.state_path)
+        if state.get('version') != STATE_VERSION:
+            raise ValueError(f"Preprocessing state version {state.get('version')} does not match {STATE_VERSION}; refit required.")
+        self.feature_range = state['feature_range']
+        self.missing_value_strategy = state['missing_value_strategy']
+        self.key_column = state['key_column']
+        self.conversion_plan = state['conversion_plan']
+        self.fill_values = state['fill_values']
+        self.numeric_columns = state['numeric_columns']
+        self.imputer = state['imputer']
+        self.scaler = state['scaler']
+        self.row_hashes = state['row_hashes']
+        logging.info(f'Preprocessing state loaded from {self.state_path}.')
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Preprocess the world data for financial aid modelling.")
+    parser.add_argument('--refit', action='store_true', help="Refit the preprocessing state even if a saved one exists.")
+    parser.add_argument('--profile', action='store_true', help="Dump a cProfile of every top-level stage next to the logs.")
+    args = parser.parse_args()
+
     raw_data_path = 'data/world-data-2023.csv'
     preprocessor = DataPreprocessor()
-    raw_data = pd.read_csv(raw_data_path)
+    preprocessor.config_manager.profile = args.profile
+    raw_data = pd.read_csv(raw_data_path, thousands=',')  # Plain thousands columns are parsed by the C reader
     logging.info('Raw data loaded successfully.')
-    preprocessed_data = preprocessor.preprocess_data(raw_data)
-    preprocessed_data_path = f'data/output/processed-data/preprocessed_world-data-2023_{preprocessor.datetime_str}.csv'
-    preprocessed_data.to_csv(preprocessed_data_path, index=False)
-    logging.info(f'Preprocessed data saved to {preprocessed_data_path}.')
\ No newline at end of file
+    previous_data_path = preprocessor.config_manager.find_latest_preprocessed_file()
+    if not args.refit and previous_data_path and os.path.exists(preprocessor.state_path):
+        preprocessor.load_state()
+        preprocessed_data = preprocessor.update_processed_data(raw_data, preprocessor.config_manager.load_processed_data(previous_data_path))
+    else:
+        preprocessed_data = preprocessor.preprocess_data(raw_data)
+    preprocessor.save_state()
+    preprocessed_data_path = preprocessor.config_manager.save_processed_data(preprocessed_data, 'preprocessed_world-data-2023', preprocessor.datetime_str)
+    logging.info(f'Preprocessed data saved to {preprocessed_data_path}.')
+    preprocessor.plot_renderer.wait()
@@ -0,0 +1,131 @@
+"""Chunked EM for Gaussian Mixture Models whose training data does not fit in memory."""
+import logging
+import numpy as np
+from scipy import linalg
+from scipy.special import logsumexp
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.mixture import GaussianMixture
+
+
+def compute_precision_cholesky(covariances: np.ndarray) -> np.ndarray:
+    """Return the Cholesky factors of the precision matrices of full covariances."""
+    n_components, n_features, _ = covariances.shape
+    precisions_cholesky = np.empty_like(covariances)
+    for k in range(n_components):
+        covariance_cholesky = linalg.cholesky(covariances[k], lower=True)
+        precisions_cholesky[k] = linalg.solve_triangular(covariance_cholesky, np.eye(n_features), lower=True).T
+    return precisions_cholesky
+
+
+class ChunkedGaussianMixture:
+    def __init__(self, n_components=3, max_iter=100, tol=1e-3, reg_covar=1e-6, random_state=None):
+        """
+        Full-covariance Gaussian Mixture fitted with EM over chunks, so memory is bounded by the chunk size.
+
+        Initialization runs MiniBatchKMeans over the chunks; every EM iteration is then one pass that
+        accumulates the sufficient statistics of each chunk before a single M-step.
+
+        :param n_components: Number of mixture components.
+        :param max_iter: Maximum number of EM passes over the data.
+        :param tol: Convergence threshold on the change of the mean log-likelihood per sample.
+        :param reg_covar: Non-negative regularization added to the diagonal of the covariances.
+        :param random_state: Seed for the MiniBatchKMeans initialization.
+        """
+        self.n_components = n_components
+        self.max_iter = max_iter
+        self.tol = tol
+        self.reg_covar = reg_covar
+        self.random_state = random_state
+
+    def estimate_log_resp(self, X: np.ndarray):
+        """Return the per-sample log-likelihood and log responsibilities of a chunk under the current parameters."""
+        n_features = X.shape[1]
+        weighted_log_prob = np.empty((X.shape[0], self.n_components))
+        for k in range(self.n_components):
+            y = (X - self.means_[k]) @ self.precisions_cholesky_[k]
+            log_det = np.log(np.diag(self.precisions_cholesky_[k])).sum()
+            weighted_log_prob[:, k] = (-0.5 * (n_features * np.log(2 * np.pi) + np.square(y).sum(axis=1))
+                                       + log_det + np.log(self.weights_[k]))
+        log_prob_norm = logsumexp(weighted_log_prob, axis=1)
+        return log_prob_norm, weighted_log_prob - log_prob_norm[:, np.newaxis]
+
+    def accumulate(self, chunks, assign):
+        """One pass over the chunks, summing responsibilities, first and second moments per component."""
+        n_samples, resp_sum, x_sum, xx_sum, log_likelihood = 0, None, None, None, 0.0
+        for X in chunks:
+            resp, chunk_log_likelihood = assign(X)
+            if resp_sum is None:
+                n_features = X.shape[1]
+                resp_sum = np.zeros(self.n_components)
+                x_sum = np.zeros((self.n_components, n_features))
+                xx_sum = np.zeros((self.n_components, n_features, n_features))
+            n_samples += X.shape[0]
+            resp_sum += resp.sum(axis=0)
+            x_sum += resp.T @ X
+            for k in range(self.n_components):
+                xx_sum[k] += (X * resp[:, k:k + 1]).T @ X
+            log_likelihood += chunk_log_likelihood
+        if n_samples == 0:
+            raise ValueError("No data was read from the chunk source.")
+        return n_samples, resp_sum, x_sum, xx_sum, log_likelihood / n_samples
+
+    def maximize(self, n_samples, resp_sum, x_sum, xx_sum):
+        """M-step from accumulated statistics."""
+        resp_sum = resp_sum + 10 * np.finfo(resp_sum.dtype).eps
+        self.weights_ = resp_sum / n_samples
+        self.means_ = x_sum / resp_sum[:, np.newaxis]
+        covariances = xx_sum / resp_sum[:, np.newaxis, np.newaxis] - np.einsum('ki,kj->kij', self.means_, self.means_)
+        covariances += self.reg_covar * np.eye(covariances.shape[1])
+        self.covariances_ = covariances
+        self.precisions_cholesky_ = compute_precision_cholesky(covariances)
+
+    def fit(self, chunk_source):
+        """
+        Fit the mixture.
+
+        :param chunk_source: Callable returning a fresh iterator of 2-D float arrays on every call.
+        :return: The fitted ChunkedGaussianMixture.
+        """
+        kmeans = MiniBatchKMeans(n_clusters=self.n_components, random_state=self.random_state, n_init=3)
+        for X in chunk_source():
+            kmeans.partial_fit(X)
+
+        def hard_assign(X):
+            return np.eye(self.n_components)[kmeans.predict(X)], 0.0
+
+        def soft_assign(X):
+            log_prob_norm, log_resp = self.estimate_log_resp(X)
+            return np.exp(log_resp), log_prob_norm.sum()
+
+        self.maximize(*self.accumulate(chunk_source(), hard_assign)[:4])
+        self.converged_ = False
+        self.lower_bound_ = -np.inf
+        for n_iter in range(1, self.max_iter + 1):
+            n_samples, resp_sum, x_sum, xx_sum, log_likelihood = self.accumulate(chunk_source(), soft_assign)
+            self.maximize(n_samples, resp_sum, x_sum, xx_sum)
+            change = log_likelihood - self.lower_bound_
+            self.lower_bound_ = log_likelihood
+            self.n_iter_ = n_iter
+            logging.info(f'Chunked EM pass {n_iter}: mean log-likelihood {log_likelihood:.4f}.')
+            if abs(change) < self.tol:
+                self.converged_ = True
+                break
+        self.n_features_in_ = self.means_.shape[1]
+        return self
+
+    def to_gaussian_mixture(self, feature_names=None) -> GaussianMixture:
+        """Return an equivalent fitted scikit-learn GaussianMixture, so the saved artifact is unchanged for consumers."""
+        model = GaussianMixture(n_components=self.n_components, covariance_type='full', tol=self.tol,
+                                reg_covar=self.reg_covar, max_iter=self.max_iter, random_state=self.random_state)
+        model.weights_ = self.weights_
+        model.means_ = self.means_
+        model.covariances_ = self.covariances_
+        model.precisions_cholesky_ = self.precisions_cholesky_
+        model.precisions_ = self.precisions_cholesky_ @ self.precisions_cholesky_.transpose(0, 2, 1)
+        model.converged_ = self.converged_
+        model.n_iter_ = self.n_iter_
+        model.lower_bound_ = self.lower_bound_
+        model.n_features_in_ = self.n_features_in_
+        if feature_names is not None:
+            model.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        return model
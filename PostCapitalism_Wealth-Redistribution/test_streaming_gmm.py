@@ -0,0 +1,56 @@
+"""Checks of the chunked EM against scikit-learn's GaussianMixture and against in-memory EM."""
+import numpy as np
+import pytest
+from sklearn.mixture import GaussianMixture
+from streaming_gmm import ChunkedGaussianMixture
+
+
+@pytest.fixture
+def X():
+    rng = np.random.default_rng(0)
+    centers = np.array([[0.0, 0.0, 0.0], [5.0, 5.0, 0.0], [0.0, 5.0, 5.0]])
+    return np.vstack([rng.normal(center, 1.0, size=(400, 3)) for center in centers])
+
+
+def chunks_of(X, size):
+    return lambda: (X[start:start + size] for start in range(0, len(X), size))
+
+
+def test_estimates_match_sklearn(X):
+    reference = GaussianMixture(n_components=3, random_state=0).fit(X)
+    mixture = ChunkedGaussianMixture(n_components=3)
+    mixture.weights_, mixture.means_ = reference.weights_, reference.means_
+    mixture.precisions_cholesky_ = reference.precisions_cholesky_
+    log_prob_norm, log_resp = mixture.estimate_log_resp(X)
+    np.testing.assert_allclose(log_prob_norm, reference.score_samples(X), rtol=1e-10)
+    np.testing.assert_allclose(np.exp(log_resp), reference.predict_proba(X), atol=1e-10)
+
+
+def test_em_pass_does_not_depend_on_chunking(X):
+    reference = GaussianMixture(n_components=3, random_state=0, max_iter=2).fit(X)
+    fitted = []
+    for chunk_size in (len(X), 97):
+        mixture = ChunkedGaussianMixture(n_components=3)
+        mixture.weights_, mixture.means_ = reference.weights_, reference.means_
+        mixture.precisions_cholesky_ = reference.precisions_cholesky_
+
+        def soft_assign(chunk):
+            log_prob_norm, log_resp = mixture.estimate_log_resp(chunk)
+            return np.exp(log_resp), log_prob_norm.sum()
+
+        mixture.maximize(*mixture.accumulate(chunks_of(X, chunk_size)(), soft_assign)[:4])
+        fitted.append(mixture)
+    np.testing.assert_allclose(fitted[0].means_, fitted[1].means_, rtol=1e-10)
+    np.testing.assert_allclose(fitted[0].covariances_, fitted[1].covariances_, rtol=1e-8)
+    np.testing.assert_allclose(fitted[0].weights_, fitted[1].weights_, rtol=1e-10)
+
+
+def test_fit_converges_to_sklearn_solution(X):
+    model = ChunkedGaussianMixture(n_components=3, tol=1e-6, random_state=0).fit(chunks_of(X, 250))
+    model = model.to_gaussian_mixture()
+    reference = GaussianMixture(n_components=3, tol=1e-6, random_state=0).fit(X)
+    # Components may come out in any order; sort both by their means
+    order = np.lexsort(model.means_.T[::-1])
+    reference_order = np.lexsort(reference.means_.T[::-1])
+    np.testing.assert_allclose(model.means_[order], reference.means_[reference_order], atol=1e-3)
+    np.testing.assert_allclose(model.score(X), reference.score(X), rtol=1e-6)
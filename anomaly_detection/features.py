@@ -0,0 +1,246 @@
+"""Connection-log features shared by the anomaly detectors, with a fast batch encoder for scoring."""
+import csv
+import logging
+import time
+from itertools import islice
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import StandardScaler, OneHotEncoder
+
+# Define the feature columns
+numeric_features = ['src_port', 'dst_port', 'duration', 'bytes_sent', 'bytes_received']
+categorical_features = ['process_name', 'dst_ip']
+
+
+def build_preprocessor():
+    """Preprocessing pipeline used in the notebooks; unseen categories encode as all zeros."""
+    return ColumnTransformer(
+        transformers=[
+            ('num', StandardScaler(), numeric_features),
+            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
+        ]
+    )
+
+
+class ConnectionEncoder:
+    """
+    Applies a fitted preprocessor to column batches without building a DataFrame per record.
+
+    The scaler statistics and one-hot category index are read once from the fitted ColumnTransformer;
+    encoding a batch is then one vectorized scale of the numeric block and one categorical lookup per
+    categorical column. Output matches preprocessor.transform densely.
+    """
+
+    def __init__(self, preprocessor: ColumnTransformer):
+        scaler = preprocessor.named_transformers_['num']
+        encoder = preprocessor.named_transformers_['cat']
+        self.mean = scaler.mean_
+        self.scale = scaler.scale_
+        self.categories = [pd.Index(categories) for categories in encoder.categories_]
+        self.offsets = len(numeric_features) + np.cumsum([0] + [len(c) for c in self.categories[:-1]])
+        self.n_features = len(numeric_features) + sum(len(c) for c in self.categories)
+
+    def encode(self, batch) -> np.ndarray:
+        """
+        Encodes a batch of connections.
+
+        :param batch: DataFrame or mapping of column name to equally long sequences.
+        :return: Dense (rows x features) array.
+        """
+        numeric = np.column_stack([np.asarray(batch[feature], dtype=np.float64) for feature in numeric_features])
+        X = np.zeros((len(numeric), self.n_features))
+        X[:, :len(numeric_features)] = (numeric - self.mean) / self.scale
+        rows = np.arange(len(numeric))
+        for feature, categories, offset in zip(categorical_features, self.categories, self.offsets):
+            codes = categories.get_indexer(np.asarray(batch[feature], dtype=object))
+            known = codes >= 0
+            X[rows[known], offset + codes[known]] = 1.0
+        return X
+
+
+def iter_batches(source, batch_size=65536):
+    """
+    Yields column batches of connection records.
+
+    :param source: Path to a CSV or Parquet file, or an iterable of record dicts.
+    :param batch_size: Maximum records per batch.
+    """
+    if isinstance(source, str) and source.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source, memory_map=True).iter_batches(batch_size=batch_size):
+            yield batch.to_pandas()
+        return
+    if isinstance(source, str):
+        yield from pd.read_csv(source, chunksize=batch_size)
+        return
+    records = iter(source)
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            return
+        yield {column: [record[column] for record in chunk] for column in chunk[0]}
+
+
+class CompactEncoder:
+    def __init__(self, method='onehot', max_categories=1000, n_hash_features=1024):
+        """
+        Memory-bounded encoder for connection logs, fitted in one streaming pass over chunks.
+
+        Numeric columns are standardized with a scaler fitted by partial_fit. Categorical columns are
+        encoded with one of:
+
+        - 'onehot': CSR one-hot over a vocabulary bounded to the max_categories most frequent values
+          per column, plus one shared column for everything else;
+        - 'hashing': CSR feature hashing of every value into n_hash_features columns per column;
+        - 'frequency': dense training frequency of the value, 0 for values outside the vocabulary.
+
+        Category counts are pruned to the most frequent values while streaming, so memory stays
+        bounded even when dst_ip cardinality explodes. Output is float32.
+        """
+        if method not in ('onehot', 'hashing', 'frequency'):
+            raise ValueError(f"Invalid encoding method: {method}")
+        self.method = method
+        self.max_categories = max_categories
+        self.n_hash_features = n_hash_features
+        self.scaler = StandardScaler()
+        self.counts = {feature: pd.Series(dtype=np.int64) for feature in categorical_features}
+
+    def partial_fit(self, batch):
+        """Updates the scaler and the bounded category counts with one batch."""
+        self.scaler.partial_fit(np.column_stack([np.asarray(batch[f], dtype=np.float64) for f in numeric_features]))
+        for feature in categorical_features:
+            counts = self.counts[feature].add(pd.Series(batch[feature]).value_counts(), fill_value=0)
+            if len(counts) > 10 * self.max_categories:
+                counts = counts.nlargest(5 * self.max_categories)
+            self.counts[feature] = counts
+        return self
+
+    def finalize(self):
+        """Fixes the vocabularies, frequencies and output layout once all batches were seen."""
+        self.vocabularies, self.frequencies = [], []
+        for feature in categorical_features:
+            top = self.counts[feature].nlargest(self.max_categories)
+            self.vocabularies.append(pd.Index(top.index))
+            self.frequencies.append((top / self.counts[feature].sum()).to_numpy(dtype=np.float32))
+        widths = {'onehot': [len(v) + 1 for v in self.vocabularies],
+                  'hashing': [self.n_hash_features] * len(categorical_features),
+                  'frequency': [1] * len(categorical_features)}[self.method]
+        self.offsets = len(numeric_features) + np.cumsum([0] + widths[:-1])
+        self.n_features = len(numeric_features) + sum(widths)
+        return self
+
+    def fit(self, source, batch_size=65536):
+        """Fits the encoder in one pass over a CSV path or an iterable of records."""
+        for batch in iter_batches(source, batch_size):
+            self.partial_fit(batch)
+        return self.finalize()
+
+    def category_columns(self, batch, position: int) -> np.ndarray:
+        """Output column of every value of one categorical column (onehot and hashing)."""
+        values = np.asarray(batch[categorical_features[position]], dtype=object)
+        if self.method == 'hashing':
+            key = categorical_features[position].ljust(16, '_')[:16]
+            codes = pd.util.hash_array(values.astype(str).astype(object), hash_key=key) % np.uint64(self.n_hash_features)
+        else:
+            codes = self.vocabularies[position].get_indexer(values)
+            codes[codes < 0] = len(self.vocabularies[position])  # shared column for rare and unseen values
+        return (self.offsets[position] + codes.astype(np.int64)).astype(np.int32)
+
+    def encode(self, batch):
+        """
+        Encodes a batch of connections.
+
+        :param batch: DataFrame or mapping of column name to equally long sequences.
+        :return: CSR float32 matrix for 'onehot' and 'hashing', dense float32 array for 'frequency'.
+        """
+        numeric = self.scaler.transform(
+            np.column_stack([np.asarray(batch[f], dtype=np.float64) for f in numeric_features])).astype(np.float32)
+        n_rows = len(numeric)
+        if self.method == 'frequency':
+            encoded = [numeric]
+            for feature, vocabulary, frequencies in zip(categorical_features, self.vocabularies, self.frequencies):
+                codes = vocabulary.get_indexer(np.asarray(batch[feature], dtype=object))
+                encoded.append(np.where(codes >= 0, frequencies[codes], 0).astype(np.float32)[:, np.newaxis])
+            return np.hstack(encoded)
+        # Every row has the numeric values followed by exactly one entry per categorical column
+        n_categorical = len(categorical_features)
+        row_width = len(numeric_features) + n_categorical
+        indices = np.empty((n_rows, row_width), dtype=np.int32)
+        indices[:, :len(numeric_features)] = np.arange(len(numeric_features), dtype=np.int32)
+        for position in range(n_categorical):
+            indices[:, len(numeric_features) + position] = self.category_columns(batch, position)
+        data = np.hstack([numeric, np.ones((n_rows, n_categorical), dtype=np.float32)])
+        indptr = np.arange(0, n_rows * row_width + 1, row_width, dtype=np.int64)
+        matrix = sparse.csr_matrix((data.ravel(), indices.ravel(), indptr), shape=(n_rows, self.n_features))
+        # Each categorical column has its own block of output columns, so every row holds one entry per block in
+        # increasing order; this finds no duplicates and only marks the matrix as canonical
+        matrix.sum_duplicates()
+        return matrix
+
+
+def sample_rows(source, sample_size=100_000, batch_size=65536, random_state=42, encoder=None) -> pd.DataFrame:
+    """
+    Uniform random sample of a stream of connections, holding at most one batch plus the sample in memory.
+
+    Every row gets a random priority and the rows with the lowest priorities are kept (bottom-k sampling).
+
+    :param encoder: Optional CompactEncoder partially fitted on every batch in the same pass, so one-shot
+        iterables of records can be both fitted on and sampled; call its finalize afterwards.
+    """
+    rng = np.random.default_rng(random_state)
+    sample, priorities = None, np.empty(0)
+    for batch in iter_batches(source, batch_size):
+        if encoder is not None:
+            encoder.partial_fit(batch)
+        batch = pd.DataFrame(batch)
+        batch_priorities = rng.random(len(batch))
+        sample = batch if sample is None else pd.concat([sample, batch], ignore_index=True)
+        priorities = np.concatenate([priorities, batch_priorities])
+        if len(sample) > sample_size:
+            keep = np.argpartition(priorities, sample_size)[:sample_size]
+            sample, priorities = sample.iloc[keep].reset_index(drop=True), priorities[keep]
+    return sample
+
+
+class StreamingScorer:
+    def __init__(self, pipeline: dict):
+        """
+        Scores connection records in micro-batches using a fitted pipeline.
+
+        :param pipeline: Dict with a fitted 'preprocessor' (ColumnTransformer or CompactEncoder) and a
+            'model' exposing decision_function.
+        """
+        preprocessor = pipeline['preprocessor']
+        self.encoder = preprocessor if isinstance(preprocessor, CompactEncoder) else ConnectionEncoder(preprocessor)
+        self.model = pipeline['model']
+
+    def score_batch(self, batch) -> (np.ndarray, np.ndarray):
+        """Returns decision scores (negative means anomalous) and labels (-1 anomaly, 1 normal) for one batch."""
+        scores = self.model.decision_function(self.encoder.encode(batch))
+        return scores, np.where(scores < 0, -1, 1)
+
+    def score_stream(self, source, batch_size=65536):
+        """
+        Yields (batch, scores, labels) for every micro-batch of the source as it is scored.
+
+        :param source: Path to a CSV or Parquet file of connections, or an iterable of record dicts.
+        :param batch_size: Records per micro-batch.
+        """
+        for batch in iter_batches(source, batch_size):
+            scores, labels = self.score_batch(batch)
+            yield batch, scores, labels
+
+
+def write_scores(scorer: StreamingScorer, source, output_path: str, batch_size=65536):
+    """Scores a source in micro-batches, appending each batch to a scores CSV as soon as it is scored."""
+    start, n_scored = time.perf_counter(), 0
+    with open(output_path, 'w', newline='') as output:
+        writer = csv.writer(output)
+        writer.writerow(['score', 'label'])
+        for batch, scores, labels in scorer.score_stream(source, batch_size):
+            writer.writerows(zip(scores.round(6), labels))
+            n_scored += len(scores)
+    elapsed = time.perf_counter() - start
+    logging.info(f"Scored {n_scored} connections in {elapsed:.2f}s ({n_scored / elapsed:,.0f}/s).")
@@ -0,0 +1,108 @@
+"""Vectorized synthetic connection-log generator for training and load-testing the detectors."""
+import argparse
+import numpy as np
+import pandas as pd
+
+# Define realistic processes and typical destinations
+process_rules_normal = {
+    'chrome.exe': ['151.101.1.69', '172.217.16.195'],
+    'firefox.exe': ['151.101.1.69', '172.217.16.195'],
+    'svchost.exe': ['93.184.216.34'],
+    'explorer.exe': ['172.217.16.195']
+}
+
+process_rules_anomalous = {
+    'svchost.exe': ['198.51.100.2'],  # Legitimate process, unusual destination
+    'unknown_process.exe': ['203.0.113.1'],  # Unrecognized process
+}
+
+
+def rule_table(process_rules: dict):
+    """
+    Flattens process rules into (process, destination) pairs and their sampling probabilities.
+
+    As in the notebooks, every process is equally likely and its destinations are equally likely.
+    """
+    processes, destinations, probabilities = [], [], []
+    for process_name, dst_ips in process_rules.items():
+        for dst_ip in dst_ips:
+            processes.append(process_name)
+            destinations.append(dst_ip)
+            probabilities.append(1.0 / (len(process_rules) * len(dst_ips)))
+    return np.array(processes, dtype=object), np.array(destinations, dtype=object), np.array(probabilities)
+
+
+def generate_block(n: int, rng: np.random.Generator, anomaly_rate=0.05, drift=0.0, progress_start=0.0,
+                   progress_end=1.0, start_time=pd.Timestamp('2023-01-01')) -> pd.DataFrame:
+    """
+    Generates n connections with the distributions of the notebooks' generate_connections, in one vectorized pass.
+
+    :param anomaly_rate: Probability that a connection follows the anomalous rules.
+    :param drift: Relative growth of the normal duration and byte scales from the start to the end of the dataset.
+    :param progress_start: Position of the block's first row in the dataset, from 0 to 1.
+    :param progress_end: Position of the block's last row in the dataset, from 0 to 1.
+    :param start_time: Day the connection timestamps fall on.
+    """
+    anomalous = rng.random(n) < anomaly_rate
+    process_name = np.empty(n, dtype=object)
+    dst_ip = np.empty(n, dtype=object)
+    for rules, mask in ((process_rules_normal, ~anomalous), (process_rules_anomalous, anomalous)):
+        processes, destinations, probabilities = rule_table(rules)
+        pairs = rng.choice(len(processes), size=int(mask.sum()), p=probabilities)
+        process_name[mask] = processes[pairs]
+        dst_ip[mask] = destinations[pairs]
+
+    drift_factor = 1.0 + drift * np.linspace(progress_start, progress_end, n)
+    duration_scale = np.where(anomalous, 10.0, 1.0 * drift_factor)
+    bytes_scale = np.where(anomalous, 10000.0, 500.0 * drift_factor)
+    return pd.DataFrame({
+        'pid': rng.integers(1000, 5000, n),
+        'process_name': process_name,
+        'src_ip': '192.168.1.100',
+        'src_port': rng.integers(1024, 65535, n),
+        'dst_ip': dst_ip,
+        'dst_port': np.where(anomalous, rng.integers(1000, 65535, n), rng.integers(80, 443, n)),
+        'duration': rng.exponential(duration_scale),
+        'bytes_sent': rng.exponential(bytes_scale),
+        'bytes_received': rng.exponential(bytes_scale),
+        'timestamp': start_time + pd.to_timedelta(rng.integers(0, 1440, n), unit='min'),
+        'is_anomaly': anomalous,
+    })
+
+
+def generate_connections(n_rows: int, chunk_size=1_000_000, anomaly_rate=0.05, drift=0.0, seed=42):
+    """Yields DataFrame chunks of at most chunk_size connections until n_rows were generated."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_rows, chunk_size):
+        n = min(chunk_size, n_rows - start)
+        yield generate_block(n, rng, anomaly_rate, drift, start / n_rows, (start + n - 1) / max(n_rows - 1, 1))
+
+
+def write_connections(path: str, n_rows: int, chunk_size=1_000_000, anomaly_rate=0.05, drift=0.0, seed=42):
+    """Streams generated connections to a CSV or Parquet file, holding one chunk in memory at a time."""
+    chunks = generate_connections(n_rows, chunk_size, anomaly_rate, drift, seed)
+    if path.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            writer = writer or pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+        if writer is not None:
+            writer.close()
+    else:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic connection logs.")
+    parser.add_argument('--rows', type=int, required=True, help="Number of connections to generate.")
+    parser.add_argument('--output', required=True, help="Output path; .parquet writes Parquet, anything else CSV.")
+    parser.add_argument('--chunk-size', type=int, default=1_000_000)
+    parser.add_argument('--anomaly-rate', type=float, default=0.05)
+    parser.add_argument('--drift', type=float, default=0.0, help="Relative growth of normal durations and byte counts.")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    write_connections(args.output, args.rows, args.chunk_size, args.anomaly_rate, args.drift, args.seed)
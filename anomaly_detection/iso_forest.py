@@ -0,0 +1,63 @@
+"""Isolation Forest anomaly detection on connection logs, with a persisted pipeline and a streaming scorer."""
+import argparse
+import logging
+import joblib
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from features import CompactEncoder, StreamingScorer, build_preprocessor, sample_rows, write_scores
+
+
+def train_iso_forest(df: pd.DataFrame, contamination=0.05, random_state=42) -> dict:
+    """Fit the preprocessor and the Isolation Forest as in train_iso_forest.ipynb."""
+    preprocessor = build_preprocessor()
+    X = preprocessor.fit_transform(df)
+    iso_forest = IsolationForest(contamination=contamination, random_state=random_state)
+    iso_forest.fit(X)
+    return {'preprocessor': preprocessor, 'model': iso_forest}
+
+
+def train_iso_forest_streaming(source, method='onehot', max_categories=1000, sample_size=1_000_000,
+                               contamination=0.05, random_state=42, batch_size=65536) -> dict:
+    """
+    Fit a CompactEncoder over the whole stream and the Isolation Forest on a bounded uniform sample of it.
+
+    Each tree only draws max_samples rows, so a sample of the stream trains the forest within fixed memory.
+    The encoder is fitted and the sample drawn in the same pass, so source may be a one-shot iterable.
+    """
+    encoder = CompactEncoder(method, max_categories=max_categories)
+    sample = sample_rows(source, sample_size, batch_size, random_state, encoder=encoder)
+    X = encoder.finalize().encode(sample)
+    iso_forest = IsolationForest(contamination=contamination, random_state=random_state)
+    iso_forest.fit(X)
+    return {'preprocessor': encoder, 'model': iso_forest}
+
+
+def save_pipeline(pipeline: dict, path='iso_forest_pipeline.pkl'):
+    joblib.dump(pipeline, path)
+
+
+def load_pipeline(path='iso_forest_pipeline.pkl') -> dict:
+    return joblib.load(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or run the Isolation Forest connection scorer.")
+    parser.add_argument('command', choices=['train', 'score'])
+    parser.add_argument('--data', required=True, help="Connections CSV to train on or to score.")
+    parser.add_argument('--model', default='iso_forest_pipeline.pkl', help="Persisted pipeline path.")
+    parser.add_argument('--output', default='scores.csv', help="Scores CSV written by the score command.")
+    parser.add_argument('--batch-size', type=int, default=65536)
+    parser.add_argument('--encoding', default='notebook', choices=['notebook', 'onehot', 'hashing', 'frequency'],
+                        help="'notebook' fits the in-memory ColumnTransformer; the others stream with a CompactEncoder.")
+    parser.add_argument('--max-categories', type=int, default=1000, help="Vocabulary bound per categorical column.")
+    parser.add_argument('--sample-size', type=int, default=1_000_000, help="Rows sampled from the stream for training.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'train' and args.encoding == 'notebook':
+        save_pipeline(train_iso_forest(pd.read_csv(args.data)), args.model)
+    elif args.command == 'train':
+        save_pipeline(train_iso_forest_streaming(args.data, args.encoding, args.max_categories, args.sample_size,
+                                                 batch_size=args.batch_size), args.model)
+    else:
+        write_scores(StreamingScorer(load_pipeline(args.model)), args.data, args.output, args.batch_size)
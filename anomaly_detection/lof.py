@@ -0,0 +1,209 @@
+"""Novelty-mode Local Outlier Factor over a persisted neighbor index that supports insertion and expiry."""
+import argparse
+import logging
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import cdist
+from sklearn.neighbors import BallTree, KDTree
+from features import CompactEncoder, StreamingScorer, build_preprocessor, sample_rows, write_scores
+
+TREES = {'kd_tree': KDTree, 'ball_tree': BallTree}
+
+
+def as_dense(X) -> np.ndarray:
+    """Neighbor trees need dense float64 vectors; sparse batches are densified one batch at a time."""
+    return np.asarray(X.toarray() if hasattr(X, 'toarray') else X, dtype=np.float64)
+
+
+class LOFIndex:
+    def __init__(self, n_neighbors=20, contamination=0.1, algorithm='kd_tree', leaf_size=40,
+                 rebuild_fraction=0.1, dead_limit=None):
+        """
+        Local Outlier Factor fitted once, answering batched novelty queries against a neighbor tree.
+
+        Reference points can be inserted and expired as traffic drifts. Inserted points are kept in a
+        small brute-force buffer and expired points are masked, until the buffer grows past
+        rebuild_fraction of the tree or more than dead_limit points are expired; the tree and the
+        k-distances and reachability densities of all points are then rebuilt in one pass.
+
+        :param n_neighbors: Number of neighbors, as in LocalOutlierFactor.
+        :param contamination: Expected share of outliers in the training data; sets the decision offset.
+        :param algorithm: 'kd_tree' for few dense dimensions, 'ball_tree' for many.
+        :param leaf_size: Leaf size of the tree.
+        :param rebuild_fraction: Buffer size, relative to the tree, that triggers a rebuild.
+        :param dead_limit: Number of expired points that triggers a rebuild; defaults to 2 * n_neighbors.
+        """
+        self.n_neighbors = n_neighbors
+        self.contamination = contamination
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self.rebuild_fraction = rebuild_fraction
+        self.dead_limit = dead_limit if dead_limit is not None else 2 * n_neighbors
+
+    def fit(self, X, times=None):
+        """
+        Builds the index over the reference points and sets the outlier threshold.
+
+        :param X: Preprocessed reference vectors.
+        :param times: Optional per-point timestamps (any numeric scale) used by expire_before.
+        """
+        X = as_dense(X)
+        self.points = X
+        self.times = np.zeros(len(X)) if times is None else np.asarray(times, dtype=np.float64)
+        self.dead = np.zeros(len(X), dtype=bool)
+        self.n_tree = 0
+        training_lof = self.rebuild()
+        self.offset_ = np.percentile(-training_lof, 100.0 * self.contamination)
+        return self
+
+    def rebuild(self) -> np.ndarray:
+        """Rebuilds the tree over all live points and recomputes their statistics; returns their LOF values."""
+        live = ~self.dead
+        self.points, self.times = self.points[live], self.times[live]
+        self.dead = np.zeros(len(self.points), dtype=bool)
+        self.n_tree = len(self.points)
+        if self.n_tree <= self.n_neighbors:
+            raise ValueError(f"At least {self.n_neighbors + 1} live reference points are required.")
+        self.tree = TREES[self.algorithm](self.points, leaf_size=self.leaf_size)
+        # The nearest neighbor of every reference point is the point itself
+        distances, indices = self.tree.query(self.points, k=self.n_neighbors + 1)
+        distances, indices = distances[:, 1:], indices[:, 1:]
+        self.k_distance = distances[:, -1]
+        self.lrd = self.local_reachability_density(distances, indices)
+        return self.lrd[indices].mean(axis=1) / self.lrd
+
+    def local_reachability_density(self, distances, indices) -> np.ndarray:
+        reach_distances = np.maximum(distances, self.k_distance[indices])
+        return 1.0 / (reach_distances.mean(axis=1) + 1e-10)
+
+    def kneighbors(self, Q, chunk_cells=2**22):
+        """
+        Distances and indices of the n_neighbors nearest live points, searching the tree and the buffer.
+
+        The buffer is searched brute force in query chunks of at most chunk_cells distances, keeping only
+        each chunk's n_neighbors nearest buffer points, so memory does not grow with the batch times the buffer.
+        """
+        n_dead_tree = int(self.dead[:self.n_tree].sum())
+        distances, indices = self.tree.query(Q, k=min(self.n_neighbors + n_dead_tree, self.n_tree))
+        if n_dead_tree:
+            distances = np.where(self.dead[indices], np.inf, distances)
+        n_buffer = len(self.points) - self.n_tree
+        if n_buffer:
+            buffer, buffer_dead = self.points[self.n_tree:], self.dead[self.n_tree:]
+            k = min(self.n_neighbors, n_buffer)
+            buffer_distances = np.empty((len(Q), k))
+            buffer_indices = np.empty((len(Q), k), dtype=indices.dtype)
+            step = max(1, chunk_cells // n_buffer)
+            for start in range(0, len(Q), step):
+                block = cdist(Q[start:start + step], buffer)
+                block[:, buffer_dead] = np.inf
+                nearest = self.smallest(block, k)
+                buffer_distances[start:start + step] = np.take_along_axis(block, nearest, axis=1)
+                buffer_indices[start:start + step] = self.n_tree + nearest
+            distances = np.hstack([distances, buffer_distances])
+            indices = np.hstack([indices, buffer_indices])
+        nearest = self.smallest(distances, self.n_neighbors)
+        distances, indices = np.take_along_axis(distances, nearest, axis=1), np.take_along_axis(indices, nearest, axis=1)
+        # Only the k selected columns are sorted, nearest first, as the tree returns them
+        order = np.argsort(distances, axis=1)
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    @staticmethod
+    def smallest(distances, k) -> np.ndarray:
+        """Column positions of the k smallest distances per row, in no particular order."""
+        if distances.shape[1] <= k:
+            return np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+        return np.argpartition(distances, k - 1, axis=1)[:, :k]
+
+    def score_samples(self, Q) -> np.ndarray:
+        """Opposite of the LOF of each query against the reference points; lower is more abnormal."""
+        distances, indices = self.kneighbors(as_dense(Q))
+        query_lrd = self.local_reachability_density(distances, indices)
+        return -(self.lrd[indices].mean(axis=1) / query_lrd)
+
+    def decision_function(self, Q) -> np.ndarray:
+        """Shifted scores; negative values are outliers."""
+        return self.score_samples(Q) - self.offset_
+
+    def predict(self, Q) -> np.ndarray:
+        """-1 for outliers and 1 for inliers."""
+        return np.where(self.decision_function(Q) < 0, -1, 1)
+
+    def insert(self, X, times=None):
+        """Adds reference points; their statistics are computed against the current live points."""
+        X = as_dense(X)
+        distances, indices = self.kneighbors(X)
+        self.points = np.vstack([self.points, X])
+        self.times = np.concatenate([self.times, np.zeros(len(X)) if times is None else np.asarray(times, dtype=np.float64)])
+        self.dead = np.concatenate([self.dead, np.zeros(len(X), dtype=bool)])
+        self.k_distance = np.concatenate([self.k_distance, distances[:, -1]])
+        self.lrd = np.concatenate([self.lrd, self.local_reachability_density(distances, indices)])
+        if len(self.points) - self.n_tree > self.rebuild_fraction * self.n_tree:
+            self.rebuild()
+
+    def expire_before(self, time):
+        """Expires every reference point with a timestamp before the given time."""
+        self.dead |= self.times < time
+        if self.dead.sum() > self.dead_limit:
+            self.rebuild()
+
+
+def train_lof(df: pd.DataFrame, n_neighbors=20, contamination=0.1, time_column=None) -> dict:
+    """Fit the preprocessor once and build the LOF index over the preprocessed training connections."""
+    preprocessor = build_preprocessor()
+    X = preprocessor.fit_transform(df)
+    times = pd.to_datetime(df[time_column]).astype('int64') / 1e9 if time_column else None
+    index = LOFIndex(n_neighbors=n_neighbors, contamination=contamination).fit(X, times)
+    return {'preprocessor': preprocessor, 'model': index}
+
+
+def train_lof_streaming(source, method='frequency', max_categories=1000, sample_size=100_000, n_neighbors=20,
+                        contamination=0.1, time_column=None, random_state=42, batch_size=65536) -> dict:
+    """
+    Fit a CompactEncoder over the whole stream and build the LOF index over a bounded uniform sample of it.
+
+    The reference set is what the index keeps in memory, so sample_size bounds its size. Only 'frequency'
+    encoding is accepted: the tree needs dense vectors, and the one-hot and hashing layouts densify to
+    thousands of columns per row, where a tree search is no faster than brute force. The encoder is fitted
+    and the sample drawn in the same pass, so source may be a one-shot iterable.
+    """
+    if method != 'frequency':
+        raise ValueError(f"LOF needs low-dimensional dense vectors; use 'frequency' encoding instead of '{method}'.")
+    encoder = CompactEncoder(method, max_categories=max_categories)
+    sample = sample_rows(source, sample_size, batch_size, random_state, encoder=encoder)
+    encoder.finalize()
+    times = pd.to_datetime(sample[time_column]).astype('int64') / 1e9 if time_column else None
+    index = LOFIndex(n_neighbors=n_neighbors, contamination=contamination, algorithm='kd_tree')
+    return {'preprocessor': encoder, 'model': index.fit(encoder.encode(sample), times)}
+
+
+def save_pipeline(pipeline: dict, path='lof_pipeline.pkl'):
+    joblib.dump(pipeline, path)
+
+
+def load_pipeline(path='lof_pipeline.pkl') -> dict:
+    return joblib.load(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or run the LOF novelty connection scorer.")
+    parser.add_argument('command', choices=['train', 'score'])
+    parser.add_argument('--data', required=True, help="Connections CSV to train on or to score.")
+    parser.add_argument('--model', default='lof_pipeline.pkl', help="Persisted pipeline path.")
+    parser.add_argument('--output', default='scores.csv', help="Scores CSV written by the score command.")
+    parser.add_argument('--batch-size', type=int, default=65536)
+    parser.add_argument('--encoding', default='notebook', choices=['notebook', 'frequency'],
+                        help="'notebook' fits the in-memory ColumnTransformer; 'frequency' streams with a CompactEncoder.")
+    parser.add_argument('--max-categories', type=int, default=1000, help="Vocabulary bound per categorical column.")
+    parser.add_argument('--sample-size', type=int, default=100_000, help="Reference rows sampled from the stream.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'train' and args.encoding == 'notebook':
+        save_pipeline(train_lof(pd.read_csv(args.data), time_column='timestamp'), args.model)
+    elif args.command == 'train':
+        save_pipeline(train_lof_streaming(args.data, args.encoding, args.max_categories, args.sample_size,
+                                          time_column='timestamp', batch_size=args.batch_size), args.model)
+    else:
+        write_scores(StreamingScorer(load_pipeline(args.model)), args.data, args.output, args.batch_size)
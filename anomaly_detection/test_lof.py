@@ -0,0 +1,72 @@
+"""Equivalence checks of LOFIndex against scikit-learn's LocalOutlierFactor in novelty mode."""
+import numpy as np
+import pytest
+from sklearn.neighbors import LocalOutlierFactor
+from lof import LOFIndex
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(500, 4)), rng.normal(scale=1.5, size=(100, 4))
+
+
+def lof_reference(X, n_neighbors=20, contamination=0.1):
+    return LocalOutlierFactor(n_neighbors=n_neighbors, contamination=contamination, novelty=True).fit(X)
+
+
+@pytest.mark.parametrize('algorithm', ['kd_tree', 'ball_tree'])
+def test_scores_match_sklearn(data, algorithm):
+    X, Q = data
+    index = LOFIndex(algorithm=algorithm).fit(X)
+    reference = lof_reference(X)
+    np.testing.assert_allclose(index.score_samples(Q), reference.score_samples(Q), rtol=1e-12)
+    np.testing.assert_allclose(index.offset_, reference.offset_, rtol=1e-12)
+    np.testing.assert_array_equal(index.predict(Q), reference.predict(Q))
+
+
+def test_insert_until_rebuild_matches_fit_on_all_points(data):
+    X, Q = data
+    index = LOFIndex(rebuild_fraction=0.1).fit(X[:400])
+    index.insert(X[400:430])
+    assert index.n_tree == 400  # still buffered
+    # The buffered points are searched exactly, so each one is its own nearest neighbor
+    distances, indices = index.kneighbors(X[400:430])
+    np.testing.assert_array_equal(distances[:, 0], 0.0)
+    np.testing.assert_array_equal(indices[:, 0], np.arange(400, 430))
+    index.insert(X[430:])
+    assert index.n_tree == 500  # rebuilt
+    np.testing.assert_allclose(index.score_samples(Q), lof_reference(X).score_samples(Q), rtol=1e-12)
+
+
+def test_expire_masks_points_then_rebuilds(data):
+    X, Q = data
+    times = np.arange(len(X), dtype=float)
+    index = LOFIndex(dead_limit=30).fit(X, times)
+    index.expire_before(20)
+    assert index.n_tree == 500  # masked, not rebuilt
+    _, indices = index.kneighbors(Q)
+    assert (indices >= 20).all()
+    index.expire_before(50)
+    assert index.n_tree == 450  # rebuilt over the live points
+    np.testing.assert_allclose(index.score_samples(Q), lof_reference(X[50:]).score_samples(Q), rtol=1e-12)
+
+
+def test_chunked_buffer_search_matches_brute_force(data):
+    X, Q = data
+    index = LOFIndex(rebuild_fraction=1.0).fit(X[:300])
+    index.insert(X[300:])
+    index.dead[[5, 350, 420]] = True
+    live = np.flatnonzero(~index.dead)
+    expected = np.sort(np.linalg.norm(Q[:, np.newaxis] - index.points[live], axis=2), axis=1)[:, :index.n_neighbors]
+    for chunk_cells in (2**22, 1000):
+        distances, indices = index.kneighbors(Q, chunk_cells=chunk_cells)
+        np.testing.assert_allclose(distances, expected, rtol=1e-12)
+        assert not index.dead[indices].any()
+
+
+@pytest.mark.parametrize('method', ['onehot', 'hashing'])
+def test_streaming_rejects_wide_encodings(method):
+    from lof import train_lof_streaming
+    with pytest.raises(ValueError):
+        train_lof_streaming([], method=method)
@@ -0,0 +1,255 @@
+"""
+End-to-end benchmarks for preprocessing, training, prediction and anomaly scoring.
+
+Every (stage, rows, columns) case runs in two fresh processes inside its own temporary folder: one that
+writes the synthetic inputs, and one that runs and times the stage. Peak RSS is that of the stage process or
+of its largest worker process (SHAP, plot rendering, model search), whichever is higher; workers running at
+the same time are not summed.
+Results are written as JSON and can be compared against a stored baseline:
+
+    python benchmarks/bench.py --output results.json
+    python benchmarks/bench.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench.py --baseline benchmarks/baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+FINAID = ROOT / 'PostCapitalism_Wealth-Redistribution'
+MLB = ROOT / 'MLB-visualization'
+ANOMALY = ROOT / 'anomaly_detection'
+
+SELECTED_FEATURES = ['Density\n(P/Km2)', 'Agricultural Land( %)', 'CPI', 'Fertility Rate',
+                     'Unemployment rate', 'Urban_population']
+
+
+def synthetic_processed_data(rows, cols):
+    """Processed-data lookalike: the selected features plus filler columns, scaled to [0, 1]."""
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(0)
+    names = SELECTED_FEATURES + [f'feature_{i}' for i in range(max(0, 35 * cols - len(SELECTED_FEATURES) - 1))]
+    data = pd.DataFrame(rng.random((rows, len(names))), columns=names)
+    data['Country'] = [f'Country_{i}' for i in range(rows)]
+    return data
+
+
+def prepare_preprocess(rows, cols):
+    """World data replicated to the requested rows and widened by cols, each column shuffled independently."""
+    import numpy as np
+    import pandas as pd
+    raw = pd.read_csv(FINAID / 'data/world-data-2023.csv')
+    rng = np.random.default_rng(0)
+    data = pd.concat([raw] * -(-rows // len(raw)), ignore_index=True).iloc[:rows]
+    for column in data.columns:
+        data[column] = rng.permutation(data[column].to_numpy())
+    data['Country'] = [f'Country_{i}' for i in range(rows)]
+    for copy in range(1, cols):
+        for column in raw.columns.drop('Country'):
+            data[f'{column}_{copy}'] = rng.permutation(data[column].to_numpy())
+    data.to_csv('world-data.csv', index=False)
+
+
+def run_preprocess(rows, cols):
+    import pandas as pd
+    from preprocessing import DataPreprocessor
+    raw = pd.read_csv('world-data.csv', thousands=',')
+    start = time.perf_counter()
+    preprocessor = DataPreprocessor()
+    preprocessor.preprocess_data(raw)
+    preprocessor.plot_renderer.wait()
+    return time.perf_counter() - start
+
+
+def prepare_train(rows, cols):
+    from config import ConfigManager
+    ConfigManager('bench').save_processed_data(synthetic_processed_data(rows, cols), 'preprocessed_bench', 'bench')
+
+
+def run_train(rows, cols):
+    from finaid_train import FinancialAidModelTrainer
+    trainer = FinancialAidModelTrainer()
+    start = time.perf_counter()
+    trainer.run()
+    trainer.plot_renderer.wait()
+    return time.perf_counter() - start
+
+
+def prepare_predict(rows, cols):
+    import joblib
+    from sklearn.mixture import GaussianMixture
+    data = synthetic_processed_data(rows, cols)
+    data.to_parquet('processed.parquet', index=False)
+    joblib.dump(GaussianMixture(n_components=3, random_state=0).fit(data[SELECTED_FEATURES]), 'model.pkl')
+
+
+def run_predict(rows, cols):
+    from predict import FinancialAidAnalysis
+    start = time.perf_counter()
+    FinancialAidAnalysis('processed.parquet', 'model.pkl', SELECTED_FEATURES, 'report.pdf').run_analysis()
+    return time.perf_counter() - start
+
+
+def prepare_mlb_train(rows, cols):
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(0)
+    pd.DataFrame({'home_runs': np.cumsum(rng.normal(size=rows))}).to_csv('series.csv', index=False)
+
+
+def run_mlb_train(rows, cols):
+    import training
+    start = time.perf_counter()
+    training.train('series.csv', 'home_runs')
+    return time.perf_counter() - start
+
+
+def prepare_anomaly(rows, cols, train_pipeline):
+    from generator import write_connections
+    write_connections('connections.parquet', rows, chunk_size=min(rows, 1_000_000))
+    train_pipeline('connections.parquet')
+
+
+def prepare_iso_forest_score(rows, cols):
+    from iso_forest import save_pipeline, train_iso_forest_streaming
+    prepare_anomaly(rows, cols, lambda path: save_pipeline(train_iso_forest_streaming(path, sample_size=100_000), 'pipeline.pkl'))
+
+
+def prepare_lof_score(rows, cols):
+    from lof import save_pipeline, train_lof_streaming
+    prepare_anomaly(rows, cols, lambda path: save_pipeline(train_lof_streaming(path, sample_size=20_000), 'pipeline.pkl'))
+
+
+def run_anomaly_score(rows, cols):
+    import joblib
+    from features import StreamingScorer
+    scorer = StreamingScorer(joblib.load('pipeline.pkl'))
+    start = time.perf_counter()
+    for _ in scorer.score_stream('connections.parquet'):
+        pass
+    return time.perf_counter() - start
+
+
+# stage -> (project folder, prepare, run, default (rows, column multiplier) cases)
+STAGES = {
+    'preprocess': (FINAID, prepare_preprocess, run_preprocess, [(195, 1), (2000, 1), (2000, 3)]),
+    'train': (FINAID, prepare_train, run_train, [(2000, 1), (20000, 1), (20000, 4)]),
+    'predict': (FINAID, prepare_predict, run_predict, [(2000, 1), (20000, 1), (20000, 4)]),
+    'mlb_train': (MLB, prepare_mlb_train, run_mlb_train, [(200, 1), (2000, 1)]),
+    'iso_forest_score': (ANOMALY, prepare_iso_forest_score, run_anomaly_score, [(100_000, 1), (1_000_000, 1)]),
+    'lof_score': (ANOMALY, prepare_lof_score, run_anomaly_score, [(20_000, 1), (100_000, 1)]),
+}
+
+
+def child(phase, stage, rows, cols):
+    """Runs one phase of a case in this process and prints its measurements as JSON."""
+    project, prepare, run, _ = STAGES[stage]
+    sys.path.insert(0, str(project))
+    os.makedirs('data/output/logs', exist_ok=True)
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    if phase == 'prepare':
+        prepare(rows, cols)
+        return
+    seconds = run(rows, cols)
+    # Worker processes only count towards RUSAGE_CHILDREN once they have exited and been waited for
+    from joblib.externals.loky import get_reusable_executor
+    get_reusable_executor().shutdown(wait=True)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+    workers_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+    print(json.dumps({'wall_seconds': seconds, 'peak_rss_mb': max(self_rss, workers_rss),
+                      'self_peak_rss_mb': self_rss, 'workers_peak_rss_mb': workers_rss}))
+
+
+def run_case(stage, rows, cols):
+    with tempfile.TemporaryDirectory(prefix=f'bench_{stage}_') as workdir:
+        command = [sys.executable, str(Path(__file__).resolve()), '--child']
+        env = dict(os.environ, MPLBACKEND='Agg')
+        subprocess.run(command + ['prepare', stage, str(rows), str(cols)], cwd=workdir, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        output = subprocess.run(command + ['run', stage, str(rows), str(cols)], cwd=workdir, env=env, check=True,
+                                capture_output=True, text=True).stdout
+    measured = json.loads(output.strip().splitlines()[-1])
+    return {'stage': stage, 'rows': rows, 'cols': cols, **measured,
+            'rows_per_second': rows / measured['wall_seconds'] if measured['wall_seconds'] else None}
+
+
+def compare(results, baseline, tolerance):
+    """Prints every case against the baseline and returns the cases that regressed beyond the tolerance."""
+    reference = {(r['stage'], r['rows'], r['cols']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        base = reference.get((result['stage'], result['rows'], result['cols']))
+        if base is None:
+            continue
+        time_ratio = result['wall_seconds'] / base['wall_seconds']
+        rss_ratio = result['peak_rss_mb'] / base['peak_rss_mb']
+        regressed = time_ratio > 1 + tolerance or rss_ratio > 1 + tolerance
+        print(f"{result['stage']:>18} rows={result['rows']:<9} cols={result['cols']} "
+              f"time x{time_ratio:.2f} rss x{rss_ratio:.2f}{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(result)
+    return regressions
+
+
+def report_scaling(results):
+    """Flags stages whose time per row grows with scale; 1.0 means linear scaling."""
+    by_stage = {}
+    for result in results:
+        by_stage.setdefault(result['stage'], []).append(result)
+    for stage, cases in by_stage.items():
+        cases = sorted(cases, key=lambda r: (r['cols'], r['rows']))
+        for small, large in zip(cases, cases[1:]):
+            growth = (large['rows'] * large['cols']) / (small['rows'] * small['cols'])
+            scaling = (large['wall_seconds'] / small['wall_seconds']) / growth
+            print(f"{stage:>18} {small['rows']}x{small['cols']} -> {large['rows']}x{large['cols']}: "
+                  f"time grows x{scaling:.2f} relative to input size{'  SCALING CLIFF' if scaling > 2 else ''}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data.")
+    parser.add_argument('--stages', nargs='+', choices=sorted(STAGES), default=sorted(STAGES))
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiplier applied to every case's row count.")
+    parser.add_argument('--output', default='benchmark_results.json', help="Machine-readable results file.")
+    parser.add_argument('--baseline', help="Results file to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown or memory growth.")
+    parser.add_argument('--save-baseline', help="Also write the results to this baseline path.")
+    args = parser.parse_args(argv)
+
+    results = []
+    for stage in args.stages:
+        for rows, cols in STAGES[stage][3]:
+            result = run_case(stage, max(1, int(rows * args.scale)), cols)
+            print(f"{stage:>18} rows={result['rows']:<9} cols={cols} {result['wall_seconds']:8.3f}s "
+                  f"{result['peak_rss_mb']:8.1f} MB {result['rows_per_second']:12,.0f} rows/s")
+            results.append(result)
+    report_scaling(results)
+
+    document = {'created': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'results': results}
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, 'w') as file:
+            json.dump(document, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))
+    else:
+        sys.exit(main())